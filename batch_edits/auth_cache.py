@@ -0,0 +1,121 @@
+"""Run-scoped cache of authority records and lookups"""
+
+import threading
+from collections import OrderedDict
+from dlx.marc import Auth, AuthSet
+
+class AuthCache():
+    """Size-bounded (LRU) cache in front of `Auth.from_query` and `Auth.lookup`.
+
+    Records and lookup values are cached separately. Lookups on prefetched
+    records are resolved from the record's heading field instead of calling
+    `Auth.lookup`. Missing authorities are cached as None.
+
+    With an AuthIndex, `exists` is answered from the index for the auths
+    in it, and only checks the database for ids the index doesn't have.
+
+    Safe to share with the writer threads of a CommitPipeline.
+    """
+
+    def __init__(self, maxsize=10000, index=None):
+        self.maxsize = maxsize
+        self.index = index
+        self.records = OrderedDict()
+        self.values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+
+    def _get(self, store, key):
+        with self.lock:
+            if key in store:
+                self.hits += 1
+                store.move_to_end(key)
+
+                return True, store[key]
+
+            self.misses += 1
+
+            return False, None
+
+    def _put(self, store, key, value):
+        with self.lock:
+            store[key] = value
+            store.move_to_end(key)
+
+            while len(store) > self.maxsize:
+                store.popitem(last=False)
+
+    def get(self, xref):
+        """Return the Auth with id `xref`, or None if it doesn't exist"""
+        found, auth = self._get(self.records, xref)
+
+        if not found:
+            auth = Auth.from_query({'_id': xref})
+            self._put(self.records, xref, auth)
+
+        return auth
+
+    def lookup(self, xref, code):
+        """Cached equivalent of `Auth.lookup(xref, code)`"""
+        found, value = self._get(self.values, (xref, code))
+
+        if not found:
+            if (auth := self.records.get(xref, False)) is not False:
+                value = _heading_value(auth, code)
+            else:
+                value = Auth.lookup(xref, code)
+
+            self._put(self.values, (xref, code), value)
+
+        return value
+
+    def prefetch(self, xrefs):
+        """Load all the uncached auths in `xrefs` with a single query"""
+        missing = list({xref for xref in xrefs if xref not in self.records})
+
+        if not missing:
+            return 0
+
+        found = {auth.id: auth for auth in AuthSet.from_query({'_id': {'$in': missing}})}
+
+        for xref in missing:
+            self._put(self.records, xref, found.get(xref))
+
+        return len(found)
+
+    def exists(self, xref):
+        """True if an auth with id `xref` exists"""
+        if self.index is not None and xref in self.index:
+            return True
+
+        if xref in self.records:
+            return self.get(xref) is not None
+
+        found, exists = self._get(self.values, (xref, None))
+
+        if not found:
+            exists = Auth.from_query({'_id': xref}, projection={'_id': 1}) is not None
+            self._put(self.values, (xref, None), exists)
+
+        return exists
+
+    def clear(self):
+        with self.lock:
+            self.records.clear()
+            self.values.clear()
+
+    def stats(self):
+        index = f', {len(self.index)} auth ids indexed' if self.index is not None else ''
+
+        return f'Auth cache: {self.hits} hits, {self.misses} misses{index}'
+
+def _heading_value(auth, code):
+    # same value Auth.lookup returns: subfield `code` of the 1XX heading field
+    if auth is None:
+        return None
+
+    heading = next((field for field in auth.datafields if field.tag[0] == '1'), None)
+    sub = heading.get_subfield(code) if heading else None
+
+    return sub.value if sub else None
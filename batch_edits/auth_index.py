@@ -0,0 +1,54 @@
+"""In-memory index of the existing authority ids"""
+
+import time, threading
+from dlx import DB
+
+class AuthIndex():
+    """The ids of all the auths, loaded with one projected scan of the auths collection.
+
+    Integer ids are kept as bits in a bytearray, one bit per possible id, which
+    takes about 125KB per million ids. Any other ids are kept in a set. With
+    `refresh`, the index is reloaded on the first check after that many
+    seconds.
+    """
+
+    def __init__(self, refresh=None):
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        bits, others, count = bytearray(), set(), 0
+
+        for doc in DB.auths.find({}, projection={'_id': 1}):
+            xref, count = doc['_id'], count + 1
+
+            if isinstance(xref, int) and xref >= 0:
+                if (i := xref >> 3) >= len(bits):
+                    # grow geometrically, as the ids don't come in order
+                    bits.extend(bytes(max(i + 1 - len(bits), len(bits))))
+
+                bits[i] |= 1 << (xref & 7)
+            else:
+                others.add(xref)
+
+        self.bits, self.others, self.count = bits, others, count
+        self.loaded = time.monotonic()
+
+        return count
+
+    def __contains__(self, xref):
+        if self.refresh and time.monotonic() - self.loaded > self.refresh:
+            with self.lock:
+                if time.monotonic() - self.loaded > self.refresh:
+                    self.load()
+
+        if isinstance(xref, int) and xref >= 0:
+            i = xref >> 3
+
+            return i < len(self.bits) and bool(self.bits[i] & 1 << (xref & 7))
+
+        return xref in self.others
+
+    def __len__(self):
+        return self.count
@@ -0,0 +1,81 @@
+"""Batched commits of edited records"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+class BulkCommitter():
+    """Accumulate edited bibs and commit them in batches.
+
+    Each record is committed with `Marc.commit`, so the documents and their
+    history are the same as for a single commit. The records of a batch are
+    committed on a pool of `threads`, so their round trips to the database
+    overlap. Records that fail `check` or whose commit fails are handed to
+    `fallback(record, last_edit)` to be committed individually, which returns
+    whether the record was committed.
+    """
+
+    def __init__(self, user, batch_size=1000, fallback=None, check=None, threads=8):
+        self.user = user
+        self.batch_size = batch_size
+        self.fallback = fallback
+        self.check = check
+        self.threads = threads
+        self.pending = []
+        self.committed = 0
+        self.fallbacks = 0
+
+    def add(self, record, last_edit=None):
+        """Queue a record. Returns True if the queue was flushed."""
+        self.pending.append((record, last_edit))
+
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+            return True
+
+        return False
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        pending, self.pending = self.pending, []
+        batch, failed = [], []
+
+        for record, last_edit in pending:
+            if self.check and not self.check(record):
+                failed.append((record, last_edit))
+            else:
+                batch.append((record, last_edit))
+
+        errors = commit_all([record for record, _ in batch], self.user, self.threads)
+        self.committed += len(batch) - len(errors)
+        failed += [(record, last_edit) for record, last_edit in batch if record.id in errors]
+
+        for record, last_edit in failed:
+            if self.fallback is None:
+                raise Exception(f'Record {record.id}: bulk commit failed after {last_edit}')
+
+            if self.fallback(record, last_edit):
+                self.fallbacks += 1
+                self.committed += 1
+
+def commit_all(records, user, threads=8, before=None):
+    """Commit `records` on a pool of threads. Returns {record id: exception} of the commits that failed.
+
+    `before(record)` is called in the commit's thread just before the commit,
+    which is skipped if it raises.
+    """
+    def commit(record):
+        try:
+            if before:
+                before(record)
+
+            record.commit(user=user)
+        except Exception as e:
+            return record.id, e
+
+    if not records:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=min(threads, len(records))) as pool:
+        return dict(result for result in pool.map(commit, records) if result)
@@ -0,0 +1,112 @@
+"""Change-set files of planned edits, applied to the database later"""
+
+import io, json
+from datetime import datetime
+from dlx import DB
+from dlx.marc import BibSet
+from batch_edits.bulk import commit_all
+from batch_edits.mrk import COMPRESSION, MAGIC
+
+def patch(record, snapshot, edit=None):
+    """One change-set line: the changes to `record` since the Snapshot `snapshot`, as whole tags.
+
+    `updated` is the record's version when it was edited, and is checked
+    when the patch is applied.
+    """
+    new, tags = record.to_bson(), snapshot.changed_tags(record)
+    updated = record.updated.isoformat() if isinstance(record.updated, datetime) else record.updated
+
+    return {
+        '_id': record.id,
+        'updated': updated,
+        'edit': edit,
+        'set': {tag: new[tag] for tag in sorted(tags) if tag in new},
+        'unset': sorted(tag for tag in tags if tag not in new)
+    }
+
+def read(path):
+    """Iterate the patches in a change-set file, compressed or not"""
+    with open(path, 'rb') as f:
+        start = f.read(6)
+
+    compression = next((name for magic, name in MAGIC.items() if start.startswith(magic)), None)
+
+    with (io.TextIOWrapper(COMPRESSION[compression](path, 'rb'), encoding='utf-8') if compression else open(path, encoding='utf-8')) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def apply(record, patch):
+    """Replace the tags of `record` changed by `patch` with the patch's fields. Returns the record"""
+    tags = set(patch['set']) | set(patch['unset'])
+    fields = [field for field in record.fields if field.tag not in tags] + type(record)(patch['set']).fields
+    # in tag order, as records are loaded
+    record.fields = sorted(fields, key=lambda field: field.tag)
+
+    return record
+
+def xrefs(patch):
+    """The auth ids linked from the fields set by a patch"""
+    return {sub['xref'] for fields in patch['set'].values() for field in fields for sub in field.get('subfields', []) if 'xref' in sub}
+
+class ChangeSetApplier():
+    """Apply change-set patches to the records and commit them in batches.
+
+    A patch is only applied if the record's `updated` is still the one it was
+    planned from, so records changed since are reported as conflicts instead
+    of being overwritten. `updated` is checked again just before each commit,
+    for records changed while the batch was being applied. Patches that fail
+    `check(patch)` or whose commit fails are reported as invalid. The patched
+    records are committed with `Marc.commit` on a pool of `threads`.
+    """
+
+    def __init__(self, user, batch_size=1000, check=None, threads=8):
+        self.user = user
+        self.batch_size = batch_size
+        self.check = check
+        self.threads = threads
+        self.pending = []
+        self.applied = 0
+        self.conflicts = []
+        self.invalid = []
+
+    def add(self, patch):
+        self.pending.append(patch)
+
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        pending, self.pending = self.pending, []
+        records = {record.id: record for record in BibSet.from_query({'_id': {'$in': [patch['_id'] for patch in pending]}})}
+        batch = []
+
+        for patch in pending:
+            record = records.get(patch['_id'])
+
+            if record is None or record.updated != _version(patch['updated']):
+                self.conflicts.append(patch['_id'])
+            elif self.check and not self.check(patch):
+                self.invalid.append(patch['_id'])
+            else:
+                batch.append(apply(record, patch))
+
+        errors = commit_all(batch, self.user, self.threads, before=_check_version)
+        self.conflicts += [record.id for record in batch if isinstance(errors.get(record.id), Conflict)]
+        self.invalid += [record.id for record in batch if record.id in errors and not isinstance(errors[record.id], Conflict)]
+        self.applied += len(batch) - len(errors)
+
+class Conflict(Exception):
+    """The record was changed since it was loaded"""
+
+def _check_version(record):
+    doc = DB.bibs.find_one({'_id': record.id}, projection={'updated': 1})
+
+    if doc is None or doc.get('updated') != record.updated:
+        raise Conflict(f'Record {record.id}: changed since it was loaded')
+
+def _version(updated):
+    return datetime.fromisoformat(updated) if isinstance(updated, str) else updated
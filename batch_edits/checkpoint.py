@@ -0,0 +1,49 @@
+"""Checkpoints for resuming interrupted runs"""
+
+import os, json
+
+class Checkpoint():
+    """The last processed record id of a run sorted by `_id`, and the ids that failed.
+
+    `output_size` is the size of the output file when the checkpoint was
+    saved, so the output of records after it can be dropped on resume.
+    Saved as JSON to `path`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.last_id = None
+        self.failed = set()
+        self.output_size = None
+
+    @classmethod
+    def load(cls, path):
+        self = cls(path)
+
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+
+            self.last_id = data.get('last_id')
+            self.failed = set(data.get('failed', []))
+            self.output_size = data.get('output_size')
+
+        return self
+
+    def save(self):
+        # write to a temp file first so a crash can't leave a truncated checkpoint
+        tmp = self.path + '.tmp'
+
+        with open(tmp, 'w') as f:
+            json.dump({'last_id': self.last_id, 'failed': sorted(self.failed), 'output_size': self.output_size}, f)
+
+        os.replace(tmp, self.path)
+
+    def query(self, query):
+        """Restrict a MDB query to the records after the checkpoint, plus the failed ones"""
+        if self.last_id is None:
+            return query
+
+        remaining = {'$or': [{'_id': {'$gt': self.last_id}}, {'_id': {'$in': sorted(self.failed)}}]}
+
+        return {'$and': [query, remaining]} if query else remaining
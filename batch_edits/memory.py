@@ -0,0 +1,86 @@
+"""Memory use monitoring for long runs"""
+
+import gc, sys, time, resource, tracemalloc
+
+MB = 1024 * 1024
+
+class MemoryMonitor():
+    """Checks the process RSS against a budget every `interval` records.
+
+    When the RSS is over `budget` (in bytes), the garbage collector is run and
+    the `release` callbacks are called to drop caches, and `over` stays True
+    until a later check is back under budget. With `trace`, the size of the
+    Python heap is also reported, from tracemalloc, which slows the run down.
+    """
+
+    def __init__(self, budget=None, interval=1000, trace=False, release=()):
+        self.budget = budget
+        self.interval = interval
+        self.trace = trace
+        self.release = list(release)
+        self.over = False
+        self.peak = 0
+        self.count = 0
+
+        if trace:
+            tracemalloc.start()
+
+    def check(self):
+        """Count a record, and measure and report the memory use if it's time to. Returns True if over budget"""
+        self.count += 1
+
+        if self.count % self.interval:
+            return self.over
+
+        rss = self.rss()
+
+        if self.budget and rss > self.budget:
+            gc.collect()
+            [f() for f in self.release]
+
+            if not self.over:
+                print(f'\nMemory: RSS {rss / MB:.1f}MB is over the budget of {self.budget / MB:.1f}MB, releasing caches and throttling read-ahead')
+
+            self.over = True
+        elif self.over:
+            print(f'\nMemory: RSS {rss / MB:.1f}MB is back under budget')
+            self.over = False
+
+        print('\n' + self.report(rss))
+
+        return self.over
+
+    def throttle(self, pending):
+        """Wait while over budget and `pending()` items are ready, so a read-ahead thread only reads when they're used up"""
+        while self.over and pending():
+            time.sleep(0.01)
+
+    def rss(self):
+        """The current resident set size in bytes, or the peak RSS where it can't be read"""
+        try:
+            with open('/proc/self/statm') as f:
+                rss = int(f.read().split()[1]) * resource.getpagesize()
+        except (OSError, IndexError, ValueError):
+            # ru_maxrss is in bytes on macOS and KB elsewhere
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+        self.peak = max(self.peak, rss)
+
+        return rss
+
+    def report(self, rss=None):
+        rss = self.rss() if rss is None else rss
+        line = f'Memory after {self.count} records: RSS {rss / MB:.1f}MB (peak {self.peak / MB:.1f}MB)'
+
+        if self.budget:
+            line += f', budget {self.budget / MB:.1f}MB'
+
+        if self.trace:
+            current, peak = tracemalloc.get_traced_memory()
+            line += f', Python heap {current / MB:.1f}MB (peak {peak / MB:.1f}MB)'
+
+        return line
+
+    def stop(self):
+        if self.trace:
+            tracemalloc.stop()
@@ -0,0 +1,71 @@
+"""Buffered, optionally compressed MRK output"""
+
+import io, os, gzip, bz2, lzma
+
+COMPRESSION = {'gzip': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}
+EXTENSIONS = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz'}
+# the first bytes of the compressed files
+MAGIC = {b'\x1f\x8b': 'gzip', b'BZh': 'bz2', b'\xfd7zXZ\x00': 'xz'}
+
+class MrkWriter():
+    """Write MRK text to a file through a large buffer.
+
+    `compression` is one of "gzip", "bz2", "xz" or None, and is taken from
+    the file extension if not given. Unless `atomic` is False, the output
+    goes to a ".part" file that is renamed to `path` when the writer is
+    closed successfully, so an incomplete run never leaves a truncated file
+    at `path`. Appending always writes to `path` directly, after cutting the
+    file to `truncate` bytes if given, which drops what was written after a
+    checkpoint. Compressed files can't be truncated.
+    """
+
+    def __init__(self, path, compression=None, buffer_size=1024 * 1024, append=False, atomic=True, truncate=None):
+        if compression is None:
+            compression = EXTENSIONS.get(os.path.splitext(path)[1])
+
+        if compression and compression not in COMPRESSION:
+            raise Exception(f'Unsupported compression: {compression}')
+
+        if append and truncate is not None:
+            if compression:
+                raise Exception(f'{path}: compressed output can\'t be truncated to resume it')
+
+            if os.path.exists(path):
+                os.truncate(path, truncate)
+
+        self.path = path
+        self.atomic = atomic and not append
+        self.target = path + '.part' if self.atomic else path
+        mode = 'ab' if append else 'wb'
+        raw = COMPRESSION[compression](self.target, mode) if compression else open(self.target, mode, buffering=0)
+        self.handle = io.TextIOWrapper(io.BufferedWriter(raw, buffer_size), encoding='utf-8')
+        self.closed = False
+
+    def write(self, text):
+        return self.handle.write(text)
+
+    def flush(self):
+        self.handle.flush()
+
+    def tell(self):
+        """Flush and return the size of the file"""
+        self.flush()
+
+        return os.path.getsize(self.target)
+
+    def close(self, complete=True):
+        """Flush and close the file. Renames it into place if `complete` and the writer is atomic."""
+        if self.closed:
+            return
+
+        self.closed = True
+        self.handle.close()
+
+        if self.atomic and complete:
+            os.replace(self.target, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(complete=exc_type is None)
@@ -0,0 +1,54 @@
+"""Committing records on background threads"""
+
+import queue, threading
+
+class CommitPipeline():
+    """Run `commit(*args)` on a pool of writer threads while the caller keeps editing.
+
+    `submit` blocks while `queue_size` commits are waiting, so editing can't
+    run too far ahead of the database. Errors are collected instead of raised,
+    and `close` returns them in the order the records were submitted.
+    """
+
+    def __init__(self, commit, writers=4, queue_size=100):
+        self.commit = commit
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.errors = []
+        self.committed = 0
+        self.submitted = 0
+        self.threads = [threading.Thread(target=self._work, daemon=True) for _ in range(writers)]
+
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, record, *args):
+        self.queue.put((self.submitted, record, args))
+        self.submitted += 1
+
+    def _work(self):
+        while (item := self.queue.get()) is not None:
+            i, record, args = item
+
+            try:
+                self.commit(record, *args)
+
+                with self.lock:
+                    self.committed += 1
+            except Exception as e:
+                with self.lock:
+                    self.errors.append((i, record.id, str(e)))
+            finally:
+                self.queue.task_done()
+
+        self.queue.task_done()
+
+    def close(self):
+        """Wait for the queued commits to finish. Returns [(record id, error message)] in submission order."""
+        for _ in self.threads:
+            self.queue.put(None)
+
+        for thread in self.threads:
+            thread.join()
+
+        return [(record_id, message) for _, record_id, message in sorted(self.errors)]
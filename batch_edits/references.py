@@ -0,0 +1,63 @@
+"""Index of the links from records to auths"""
+
+from dlx import DB
+
+class ReferenceIndex():
+    """The number of links to each auth, from one aggregation over the xrefs of a collection.
+
+    `query` limits the records scanned. With `xrefs`, only the links to those
+    auths are counted, and the ids of the linking records are kept as well.
+    """
+
+    def __init__(self, collection=None, query=None, xrefs=None):
+        collection = DB.bibs if collection is None else collection
+        self.counts, self.records = {}, {}
+
+        for doc in collection.aggregate(_pipeline(query, xrefs), allowDiskUse=True):
+            self.counts[doc['_id']] = doc['count']
+
+            if 'records' in doc:
+                self.records[doc['_id']] = sorted(doc['records'])
+
+    def __contains__(self, xref):
+        return xref in self.counts
+
+    def __len__(self):
+        return len(self.counts)
+
+    def count(self, xref):
+        return self.counts.get(xref, 0)
+
+    def missing(self, exists=None, chunk_size=10000):
+        """The linked auth ids that don't exist, checked with `exists(xref)` or by querying the auths in chunks"""
+        xrefs = sorted(self.counts)
+
+        if exists:
+            return [xref for xref in xrefs if not exists(xref)]
+
+        missing = []
+
+        for i in range(0, len(xrefs), chunk_size):
+            chunk = xrefs[i:i + chunk_size]
+            found = {doc['_id'] for doc in DB.auths.find({'_id': {'$in': chunk}}, projection={'_id': 1})}
+            missing += [xref for xref in chunk if xref not in found]
+
+        return missing
+
+def _pipeline(query, xrefs):
+    stages = [{'$match': query}] if query else []
+    group = {'_id': '$fields.v.subfields.xref', 'count': {'$sum': 1}}
+
+    if xrefs is not None:
+        group['records'] = {'$addToSet': '$_id'}
+
+    return stages + [
+        # the tags are the keys of the record documents
+        {'$project': {'fields': {'$objectToArray': '$$ROOT'}}},
+        {'$unwind': '$fields'},
+        {'$match': {'fields.k': {'$regex': r'^\d{3}$'}}},
+        {'$unwind': '$fields.v'},
+        {'$unwind': '$fields.v.subfields'},
+        {'$match': {'fields.v.subfields.xref': {'$in': list(xrefs)} if xrefs is not None else {'$exists': True}}},
+        {'$group': group}
+    ]
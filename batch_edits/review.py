@@ -0,0 +1,60 @@
+"""Review of the changes of a run, grouped by edit and kind of change"""
+
+from batch_edits.snapshot import field_state, compare
+
+class Review():
+    """Collects a signature for each change each edit makes, such as "edit_5: deleted 008".
+
+    Records with the same signature form a group, which is shown once with its
+    count and some sample record ids, to be approved or rejected as a whole.
+    `before` and `after` are called around each edit, as for EditStats.
+    """
+
+    def __init__(self, samples=5):
+        self.samples = samples
+        self.groups = {}
+        self.current = set()
+
+    def start(self):
+        """Start collecting the signatures of a new record"""
+        self.current = set()
+
+    def before(self, record):
+        return field_state(record)
+
+    def after(self, name, state, record):
+        moves, tags = compare(state, record)
+        changes = [f'moved {a} to {b}' for a, b in moves]
+
+        for tag, (removed, added) in tags.items():
+            changes.append(('changed' if removed and added else 'deleted' if removed else 'added') + f' {tag}')
+
+        if changes:
+            self.current.add(f'{name}: ' + ', '.join(sorted(changes)))
+
+    def finish(self, record_id):
+        """Add the record to the groups of its signatures. Returns the signatures"""
+        for signature in self.current:
+            group = self.groups.setdefault(signature, {'count': 0, 'samples': []})
+            group['count'] += 1
+
+            if len(group['samples']) < self.samples:
+                group['samples'].append(record_id)
+
+        return sorted(self.current)
+
+    def prompt(self, ask=None):
+        """Ask for the approval of each group, largest first. Returns the approved signatures"""
+        ask = ask or input
+        approved = set()
+        groups = sorted(self.groups.items(), key=lambda x: (-x[1]['count'], x[0]))
+        print(f'\n{len(groups)} group(s) of changes to review. Records are committed if all their groups are approved.')
+
+        for i, (signature, group) in enumerate(groups, 1):
+            samples = ', '.join(map(str, group['samples']))
+            print(f'\n[{i}/{len(groups)}] {signature}\n{group["count"]} record(s), e.g. {samples}')
+
+            if ask('Approve? (y/n): ').lower() == 'y':
+                approved.add(signature)
+
+        return approved
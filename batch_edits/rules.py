@@ -0,0 +1,165 @@
+"""Declarative field edits loaded from JSON"""
+
+import re, json
+
+ACTIONS = ('delete_field', 'delete_subfield', 'change_tag', 'clear_indicators')
+
+class RuleSet():
+    """A list of field edit rules, compiled into tables of the rules for each tag.
+
+    Each rule is a JSON object such as:
+
+        {"action": "delete_subfield", "tag": "040", "code": "b", "types": ["bibliographic"]}
+
+    `action` is one of "delete_field", "delete_subfield" (with "code"),
+    "change_tag" (with "to") or "clear_indicators". The optional keys are
+    "name", "types", the record types the rule is limited to, and
+    "conditions", a list of [code, value] pairs. A rule with conditions only
+    applies to the fields that have any of the subfield values. A rule with
+    "match", such as {"code": "a", "prefixes": ["UND", "UNP"], "not": true},
+    only applies to the fields matched by the `Pattern` built from it.
+
+    The rules apply in order. A field moved by "change_tag" gets the later
+    rules for its new tag.
+    """
+
+    def __init__(self, rules, types=None):
+        self.rules = [_compile(rule, types) for rule in rules]
+        self.tables = {}
+
+    @classmethod
+    def load(cls, path, types=None):
+        """Load a JSON list of rules. `types` are the valid record types, if given"""
+        with open(path) as f:
+            return cls(json.load(f), types)
+
+    @property
+    def tags(self):
+        """The tags the rules act on"""
+        return frozenset(rule['tag'] for rule in self.rules)
+
+    @property
+    def adds(self):
+        """The tags the rules may move fields to"""
+        return frozenset(rule['to'] for rule in self.rules if rule['action'] == 'change_tag')
+
+    def table(self, types=None):
+        """{tag: [(position, rule)]} of the rules that apply to records of `types`.
+
+        Rules limited to record types don't apply if `types` is None.
+        """
+        if (table := self.tables.get(types)) is None:
+            table = {}
+
+            for i, rule in enumerate(self.rules):
+                if rule['types'] is None or (types is not None and types <= rule['types']):
+                    table.setdefault(rule['tag'], []).append((i, rule))
+
+            self.tables[types] = table
+
+        return table
+
+    def apply(self, record, types=None):
+        """Apply the rules to `record` in one pass over its fields. Returns the record"""
+        table = self.table(types)
+
+        if table.keys() & {field.tag for field in record.fields}:
+            record.fields = [field for field in record.fields if _apply(field, table)]
+
+        return record
+
+def _compile(rule, types):
+    rule = dict(rule)
+    action, tag = rule.get('action'), rule.get('tag')
+
+    if action not in ACTIONS:
+        raise Exception(f'Invalid rule action: {action}')
+
+    if not isinstance(tag, str) or len(tag) != 3:
+        raise Exception(f'Invalid rule tag: {tag}')
+
+    for key in {'delete_subfield': ['code'], 'change_tag': ['to']}.get(action, []):
+        if not rule.get(key):
+            raise Exception(f'Rule "{action}" on {tag} requires "{key}"')
+
+    if tag[:2] == '00' and (action in ('delete_subfield', 'clear_indicators') or rule.get('conditions') or rule.get('match')):
+        raise Exception(f'Rule "{action}" on {tag}: controlfields have no subfields or indicators')
+
+    if rule.get('types') is not None:
+        rule['types'] = frozenset([rule['types']] if isinstance(rule['types'], str) else rule['types'])
+
+        if types and (unknown := rule['types'] - set(types)):
+            raise Exception(f'Unknown record type(s): {", ".join(sorted(unknown))}')
+    else:
+        rule['types'] = None
+
+    # {code: {values}}, so a field is checked in one pass over its subfields
+    conditions = {}
+
+    for code, value in rule.get('conditions') or []:
+        conditions.setdefault(code, set()).add(value)
+
+    rule['conditions'] = conditions
+
+    match = rule.get('match')
+    rule['match'] = Pattern(match.get('code'), match.get('prefixes', ()), match.get('patterns', ()), match.get('not', False)) if match else None
+
+    return rule
+
+def _apply(field, table):
+    """Apply the rules in `table` for the field's tag. Returns False if the field is deleted"""
+    rules, i = table.get(field.tag, []), 0
+
+    while i < len(rules):
+        position, rule = rules[i]
+        i += 1
+
+        if rule['conditions'] and not any(sub.value in rule['conditions'].get(sub.code, ()) for sub in field.subfields):
+            continue
+
+        if rule['match'] and not rule['match'](field):
+            continue
+
+        action = rule['action']
+
+        if action == 'delete_field':
+            return False
+        elif action == 'delete_subfield':
+            field.subfields = [x for x in field.subfields if x.code != rule['code']]
+        elif action == 'clear_indicators':
+            field.ind1, field.ind2 = ' ', ' '
+        elif action == 'change_tag':
+            field.tag = rule['to']
+            rules = table.get(field.tag, [])
+            i = next((n for n, (p, _) in enumerate(rules) if p > position), len(rules))
+
+    return True
+
+class Pattern():
+    """Matches a subfield value against a set of prefixes and regular expressions.
+
+    The prefixes and expressions are compiled into one regex, which is matched
+    at the start of the first `code` subfield of a field. With `negate`, the
+    fields that don't match are matched instead. Fields without the subfield
+    are matched as an empty value.
+    """
+
+    def __init__(self, code, prefixes=(), patterns=(), negate=False):
+        # longest first, so a shorter prefix can't shadow a longer one
+        alternatives = [re.escape(x) for x in sorted(prefixes, key=len, reverse=True)] + [f'(?:{x})' for x in patterns]
+
+        if not code or not alternatives:
+            raise Exception('A pattern requires a subfield code and at least one prefix or pattern')
+
+        self.code = code
+        self.regex = re.compile('|'.join(alternatives))
+        self.negate = negate
+
+    def __call__(self, field):
+        return bool(self.regex.match(field.get_value(self.code) or '')) != self.negate
+
+def delete_fields(record, tag, test):
+    """Delete the `tag` fields for which `test(field)` is true, in one pass over the fields. Returns the record"""
+    record.fields = [field for field in record.fields if field.tag != tag or not test(field)]
+
+    return record
@@ -1,15 +1,40 @@
 """Run a series of specified edits on a set of DLX records"""
 
-import sys, os, re, json, inspect, time, copy
-from argparse import ArgumentParser
+import sys, os, io, json, inspect, time, functools, cProfile, queue, threading, tempfile, multiprocessing
+from argparse import ArgumentParser, Namespace
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, redirect_stdout
+from itertools import repeat
 from datetime import datetime
 from pytz import timezone
 from batch_edits.module import Class # rename package, module and class
+from batch_edits.auth_cache import AuthCache
+from batch_edits.auth_index import AuthIndex
+from batch_edits.bulk import BulkCommitter
+from batch_edits.checkpoint import Checkpoint
+from batch_edits.snapshot import Snapshot
+from batch_edits.mrk import MrkWriter
+from batch_edits.stats import EditStats
+from batch_edits.timing import Timings
+from batch_edits.pipeline import CommitPipeline
+from batch_edits.memory import MemoryMonitor, MB
+from batch_edits import changeset
+from batch_edits.review import Review
+from batch_edits.references import ReferenceIndex
+from batch_edits.rules import RuleSet, Pattern, delete_fields
 from dlx import DB
-from dlx.marc import BibSet, Bib, Auth, Datafield, Diff, Query, Condition, InvalidAuthXref
+from dlx.marc import BibSet, Bib, Datafield, Query, Condition, InvalidAuthXref
 
 USER = 'batch_edit_' + str(int(time.time()))
 OUT = None
+AUTH_CACHE = AuthCache()
+STATS = None
+TIMINGS = None
+PIPELINE = None
+MEMORY = None
+REVIEW = None
+STOP = None
 
 def reimport_and_find_invalid_xrefs(record, tag=None):
     """Refresh linked values from auth records and report unresolved xrefs.
@@ -39,16 +64,110 @@ def reimport_and_find_invalid_xrefs(record, tag=None):
 
             seen.add(key)
 
-            if not Auth.from_query({'_id': xref}, projection={'_id': 1}):
+            if not AUTH_CACHE.exists(xref):
                 invalid.append(key)
 
     return invalid
 
+def _commit(bib, before, last_edit, args):
+    if args.partial:
+        _commit_partial(bib, before, last_edit)
+    else:
+        _commit_with_reimport_retry(bib, last_edit)
+
+def _commit_partial(bib, before, last_edit):
+    """Commit a record loaded with a projection, with the tags that changed since the Snapshot `before`.
+
+    The projected record doesn't have all its fields, so the full record is
+    read again, the changed tags are copied onto it, and it is committed whole
+    with `Marc.commit`, which validates it and saves it to the history. Only
+    the reads of the records the edits don't change are smaller.
+    """
+    if (record := Bib.from_id(bib.id)) is None:
+        raise Exception(f'Record {bib.id}: commit failed after {last_edit}; record not found')
+
+    record = changeset.apply(record, changeset.patch(bib, before, last_edit))
+    _commit_with_reimport_retry(record, last_edit)
+    bib.updated, bib.user = record.updated, record.user
+
+def _xrefs(record):
+    return {sub.xref for field in record.datafields for sub in field.subfields if getattr(sub, 'xref', None)}
+
+def _xrefs_exist(record):
+    return all(AUTH_CACHE.exists(xref) for xref in _xrefs(record))
+
+def _prefetched(records, page_size, read_ahead=0):
+    """Yield records a page at a time, loading the page's linked auths into the cache first.
+
+    With `read_ahead`, up to that many pages are read and prefetched on a
+    background thread while the current page is being edited.
+    """
+    pages = map(_prefetch_page, _pages(records, page_size))
+
+    if read_ahead:
+        pages = _read_ahead(pages, read_ahead)
+
+    for page in pages:
+        page = deque(page)
+
+        # don't keep the records of the page that have been processed
+        while page:
+            yield page.popleft()
+
+def _pages(records, page_size):
+    page = []
+
+    for record in records:
+        page.append(record)
+
+        if len(page) == page_size:
+            yield page
+            page = []
+
+    if page:
+        yield page
+
+def _prefetch_page(page):
+    AUTH_CACHE.prefetch(set().union(*[_xrefs(r) for r in page]))
+
+    return page
+
+def _read_ahead(items, size):
+    """Iterate `items` on a background thread, keeping up to `size` of them ready"""
+    ready = queue.Queue(maxsize=size)
+    done = object()
+
+    def read():
+        try:
+            for item in items:
+                ready.put((item, None))
+
+                if MEMORY:
+                    # when over the memory budget, only read once the items ready are used
+                    MEMORY.throttle(lambda: not ready.empty())
+        except Exception as e:
+            ready.put((None, e))
+        finally:
+            ready.put((done, None))
+
+    threading.Thread(target=read, daemon=True).start()
+
+    while True:
+        item, error = ready.get()
+
+        if error:
+            raise error
+
+        if item is done:
+            return
+
+        yield item
+
 def _commit_with_reimport_retry(bib, last_edit):
-    """Commit once, and retry after xref re-import if invalid auth xrefs are hit."""
+    """Commit once, and retry after xref re-import if invalid auth xrefs are hit. Returns True or raises."""
     try:
         bib.commit(user=USER)
-        return
+        return True
     except InvalidAuthXref:
         invalid_xrefs = reimport_and_find_invalid_xrefs(bib)
 
@@ -59,7 +178,7 @@ def _commit_with_reimport_retry(bib, last_edit):
         # InvalidAuthXref was raised, but re-import resolved links; retry commit once.
         try:
             bib.commit(user=USER)
-            return
+            return True
         except Exception as e:
             raise Exception(f'Record {bib.id}: commit failed after {last_edit}; original error: {e}') from e
     except Exception as e:
@@ -73,27 +192,77 @@ def _commit_with_reimport_retry(bib, last_edit):
 
 def get_args():
     parser = ArgumentParser()
+    parser.add_argument('command', nargs='?', choices=['run', 'plan', 'apply'], default='run', help='run: edit and output the records. plan: edit and save the changes to --plan_file without writing to the database. apply: write the changes in --plan_file to the database')
     parser.add_argument('--connect', required=True, help='DLX connection string')
     parser.add_argument('--database', help='The database name')
     parser.add_argument('--query', help='JSON MDB query document')
     parser.add_argument('--querystring', help='DLX query string')
     parser.add_argument('--limit', type=int, default=0, help='limit the number of records processed')
-    parser.add_argument('--output', required=True, choices=['db', 'mrk'], help='')
+    parser.add_argument('--output', choices=['db', 'mrk', 'stats'], help='stats: run the edits and report the changes made by each edit, without writing anything')
+    parser.add_argument('--dry_run', action='store_true', help='Same as --output stats')
     parser.add_argument('--output_file', help='File to write output to if output is mrk')
+    parser.add_argument('--plan_file', help='JSON lines change-set file written by plan and read by apply')
+    parser.add_argument('--compression', choices=['gzip', 'bz2', 'xz'], help='Compress the output or plan file (default: from the file extension)')
     parser.add_argument('--skip_confirm', action='store_true', help='')
     parser.add_argument('--view_changes', action='store_true', help='')
+    parser.add_argument('--review', action='store_true', help='Instead of confirming each record, review the changes grouped by edit at the end of the run, and commit the records whose changes are all approved (output db)')
     parser.add_argument('--initials', help='Initials to use for the 999 field (default: js)')
+    parser.add_argument('--auth_cache_size', type=int, default=10000, help='Max number of auth records and lookups to cache during the run')
+    parser.add_argument('--auth_index', action='store_true', help='Load the ids of all the auths at the start of the run, to check xrefs without querying the database')
+    parser.add_argument('--check_xrefs', action='store_true', help='Before the run, report the links to auths that don\'t exist, which would make the commits of the linking records fail')
+    parser.add_argument('--auth_index_refresh', type=int, default=0, help='Reload the auth id index after this many seconds (default: never)')
+    parser.add_argument('--batch_size', type=int, default=0, help='Commit changed records in batches of this size, several at a time (requires --skip_confirm)')
+    parser.add_argument('--normalize', action='store_true', help='Apply the indicator, subfield and tag rules of the edits that only clean fields in one pass over each record')
+    parser.add_argument('--dispatch', choices=['members', 'registry'], default='members', help='Run every edit_ function in the module (members), or only the registered edits that apply to the record type and tags present (registry)')
+    parser.add_argument('--edits', help='Comma separated names of the edit_ functions to run (default: all, or none with --rules)')
+    parser.add_argument('--rules', help='JSON file of field edit rules to apply after the edit_ functions (see batch_edits.rules)')
+    parser.add_argument('--partial', action='store_true', help='Only load the tags used by the edits. Changed records are read again in full and committed whole, so this only saves on the records the edits don\'t change (output db or plan)')
+    parser.add_argument('--prefilter', action='store_true', help='Only fetch records that at least one of the edits could change')
+    parser.add_argument('--timings', action='store_true', help='Report the wall time and latency percentiles of each pipeline stage and edit')
+    parser.add_argument('--timings_file', help='Also save the timings to this file as JSON')
+    parser.add_argument('--profile', help='Run under cProfile and save the stats to this file')
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes to run the edits in, each taking a range of record ids. Without --checkpoint, all of them stop at the first failed record')
+    parser.add_argument('--writers', type=int, default=0, help='Commit records on this many background threads while editing continues (requires --skip_confirm)')
+    parser.add_argument('--queue_size', type=int, default=100, help='Max number of records waiting for a writer thread')
+    parser.add_argument('--memory_budget', type=int, default=0, help='Max RSS in MB of each process. When over it, caches are released and read-ahead is limited to the page being edited')
+    parser.add_argument('--memory_interval', type=int, default=1000, help='Check and report the memory use every this many records (with --memory_budget or --trace_memory)')
+    parser.add_argument('--trace_memory', action='store_true', help='Also report the Python heap size, using tracemalloc')
+    parser.add_argument('--checkpoint', help='File to save the last processed record id and the failed ids to')
+    parser.add_argument('--checkpoint_interval', type=int, default=100, help='Save the checkpoint every this many records')
+    parser.add_argument('--resume', action='store_true', help='Continue from the record after the last one in --checkpoint, retrying the failed ones. Output written after the checkpoint is dropped, so compressed output can\'t be resumed')
+    parser.add_argument('--read_batch_size', type=int, help='Number of records the DB cursor fetches per round trip')
+    parser.add_argument('--read_ahead', type=int, default=0, help='Number of pages to read and prefetch on a background thread while editing')
+    parser.add_argument('--page_size', type=int, default=500, help='Number of bibs to read before prefetching their linked auths')
 
     return parser.parse_args()
 
 def run(**kwargs):
     if kwargs:
         sys.argv = [sys.argv[0]]
+
+        if command := kwargs.pop('command', None):
+            sys.argv.append(command)
         
         for param, arg in kwargs.items():
             sys.argv.append(f'--{param}' if isinstance(arg, bool) else f'--{param}={arg}')
 
     args = get_args()
+    # the date of the 999 stamp is the date the run started
+    args.stamp_date = _eastern_date()
+
+    if args.command in ('plan', 'apply'):
+        if not args.plan_file:
+            raise Exception(f'{args.command} requires --plan_file')
+
+        args.output = 'plan' if args.command == 'plan' else None
+    elif args.dry_run:
+        args.output = 'stats'
+    elif not args.output:
+        raise Exception('--output is required')
+
+    global AUTH_CACHE, OUT, STATS, TIMINGS, MEMORY, REVIEW
+    STATS = EditStats() if args.output == 'stats' else None
+    TIMINGS = Timings() if args.timings or args.timings_file else None
 
     if DB.database_name == 'testing':
         # let the test module connect to the DB
@@ -101,23 +270,461 @@ def run(**kwargs):
     else:
         DB.connect(args.connect, database=args.database)
 
+    AUTH_CACHE = _auth_cache(args)
+    MEMORY = _memory_monitor(args)
+
+    if args.command == 'apply':
+        return _apply_plan(args)
+
+    if args.resume and not args.checkpoint:
+        raise Exception('--resume requires --checkpoint')
+
+    query = Query.from_string(args.querystring) if args.querystring else json.loads(args.query) if args.query else {}
+    edits = _get_edits(args.dispatch, args.edits, args.rules)
+    checkpoint = None
+
+    if args.partial:
+        if args.output not in ('db', 'plan'):
+            raise Exception('--partial requires --output db or plan')
+
+        if args.batch_size:
+            raise Exception('--partial is not supported with --batch_size')
+
+    if args.writers:
+        if args.output != 'db' or not args.skip_confirm:
+            raise Exception('--writers requires --output db and --skip_confirm')
+
+        if args.batch_size or args.checkpoint:
+            raise Exception('--writers is not supported with --batch_size or --checkpoint')
+
+    REVIEW = None
+
+    if args.review:
+        if args.output != 'db' or args.skip_confirm:
+            raise Exception('--review requires --output db, without --skip_confirm')
+
+        if args.workers > 1 or args.writers or args.checkpoint:
+            raise Exception('--review is not supported with --workers, --writers or --checkpoint')
+
+        # the changes are saved as a plan until they are reviewed, uncompressed as it's only kept for the run
+        REVIEW = Review()
+        args.output = 'plan'
+        args.compression = None
+        fd, args.plan_file = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+
+    if args.check_xrefs:
+        _check_xrefs(query.compile() if isinstance(query, Query) else query)
+
+    if args.prefilter:
+        if prefilter := prefilter_query(edits):
+            query = query.compile() if isinstance(query, Query) else query
+            total = DB.bibs.count_documents(query)
+            query = {'$and': [query, prefilter]} if query else prefilter
+            print(f'Prefilter: {total - DB.bibs.count_documents(query)} of {total} records skipped')
+        else:
+            print('Prefilter: not all edits can be prefiltered, no records skipped')
+
+    if args.checkpoint:
+        checkpoint = Checkpoint.load(args.checkpoint) if args.resume else Checkpoint(args.checkpoint)
+        query = checkpoint.query(query.compile() if isinstance(query, Query) else query)
+
+    OUT = None
+
+    # on resume, drop the output of the records after the checkpoint, as they are processed again
+    truncate = (checkpoint.output_size or 0) if args.resume else None
+
     if args.output == 'mrk':
         if args.output_file:
-            OUT = open(args.output_file, 'w')
+            # write in place when checkpointing, so the output is kept up to date with the checkpoint
+            OUT = MrkWriter(args.output_file, compression=args.compression, append=args.resume, atomic=not args.checkpoint, truncate=truncate)
         else:
             OUT = sys.stdout
+    elif args.output == 'plan':
+        OUT = MrkWriter(args.plan_file, compression=args.compression, append=args.resume, atomic=not args.checkpoint, truncate=truncate)
 
-    if args.initials:
-        initials = args.initials
+    profiler = cProfile.Profile() if args.profile else None
 
-    query = Query.from_string(args.querystring) if args.querystring else json.loads(args.query) if args.query else {}
-    bibs = BibSet.from_query(query, limit=args.limit)
-    edits = [f for name, f in inspect.getmembers(sys.modules[__name__], inspect.isfunction) if name[:5] == 'edit_']
-    i, status = 0, ''
+    try:
+        if profiler:
+            profiler.enable()
+
+        if args.workers > 1:
+            _run_parallel(args, query.compile() if isinstance(query, Query) else query, checkpoint)
+        else:
+            _run_serial(args, query, edits, checkpoint)
+    except BaseException:
+        if isinstance(OUT, MrkWriter):
+            OUT.close(complete=False)
+
+        raise
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
 
-    for bib in bibs:
+        if MEMORY:
+            print('\n' + MEMORY.report())
+            MEMORY.stop()
+
+    if isinstance(OUT, MrkWriter):
+        OUT.close()
+
+    if REVIEW:
+        _commit_reviewed(args)
+
+    if STATS:
+        print(STATS.report())
+
+    if TIMINGS:
+        print(TIMINGS.report())
+
+        if args.timings_file:
+            TIMINGS.save(args.timings_file)
+
+def _auth_cache(args):
+    if args.auth_index:
+        with _timed('auth index'):
+            index = AuthIndex(refresh=args.auth_index_refresh)
+
+        print(f'Auth index: {len(index)} auth ids loaded')
+
+        return AuthCache(maxsize=args.auth_cache_size, index=index)
+
+    return AuthCache(maxsize=args.auth_cache_size)
+
+def _apply_plan(args):
+    """Write the changes in the change-set file to the database, without running the edits"""
+    applier = changeset.ChangeSetApplier(USER, batch_size=args.batch_size or 1000, check=_patch_xrefs_exist)
+    i = 0
+
+    for patch in changeset.read(args.plan_file):
+        applier.add(patch)
         i += 1
 
+        if args.limit and i == args.limit:
+            break
+
+    applier.flush()
+
+    for _id in applier.conflicts:
+        print(f'--> record id {_id}: changed or deleted since the plan was made, not updated')
+
+    for _id in applier.invalid:
+        print(f'--> record id {_id}: invalid xref(s) in the planned changes, not updated')
+
+    print(f'Records updated: {applier.applied} of {i} ({len(applier.conflicts)} conflicts, {len(applier.invalid)} invalid)')
+    print(AUTH_CACHE.stats())
+
+    return applier
+
+def _commit_reviewed(args):
+    """Ask for the approval of the groups of changes, and commit the records whose groups are all approved"""
+    approved = REVIEW.prompt()
+    applier = changeset.ChangeSetApplier(USER, batch_size=args.batch_size or 1000, check=_patch_xrefs_exist)
+    rejected = 0
+
+    try:
+        for patch in changeset.read(args.plan_file):
+            if set(patch['groups']) <= approved:
+                applier.add(patch)
+            else:
+                rejected += 1
+
+        applier.flush()
+    finally:
+        os.remove(args.plan_file)
+
+    for _id in applier.conflicts:
+        print(f'--> record id {_id}: changed or deleted during the review, not updated')
+
+    for _id in applier.invalid:
+        print(f'--> record id {_id}: invalid xref(s), not updated')
+
+    print(f'Records updated: {applier.applied} ({rejected} rejected, {len(applier.conflicts)} conflicts, {len(applier.invalid)} invalid)')
+
+    return applier
+
+def _patch_xrefs_exist(patch):
+    return all(AUTH_CACHE.exists(xref) for xref in changeset.xrefs(patch))
+
+def _check_xrefs(query):
+    """Report the linked auths that don't exist, which make commits fail with InvalidAuthXref. Returns their ids"""
+    with _timed('xref check'):
+        refs = ReferenceIndex(query=query)
+        missing = refs.missing(AUTH_CACHE.exists if AUTH_CACHE.index is not None else None)
+
+    if not missing:
+        print(f'Xrefs: all {len(refs)} linked auths exist')
+
+        return missing
+
+    records, bibs = ReferenceIndex(query=query, xrefs=missing).records, set()
+
+    for xref in missing:
+        print(f'--> auth id {xref}: not found, linked from bib(s) {", ".join(map(str, records.get(xref, [])))}')
+        bibs.update(records.get(xref, []))
+
+    print(f'Xrefs: {len(missing)} of {len(refs)} linked auths not found, {len(bibs)} record(s) can\'t be committed until they are fixed')
+
+    return missing
+
+def _memory_monitor(args):
+    if args.memory_budget or args.trace_memory:
+        budget = args.memory_budget * MB if args.memory_budget else None
+
+        return MemoryMonitor(budget=budget, interval=args.memory_interval, trace=args.trace_memory, release=[AUTH_CACHE.clear])
+
+def _run_serial(args, query, edits, checkpoint=None):
+    bibs = _find(query, args, edits, sort=[('_id', 1)] if checkpoint else None)
+    i, status, last_id = 0, '', None
+    counts, errors = Counter(), []
+    committer = None
+
+    if args.output == 'db' and args.skip_confirm and args.batch_size:
+        fallback = _commit_or_report(errors) if checkpoint else _commit_with_reimport_retry
+        committer = BulkCommitter(USER, batch_size=args.batch_size, fallback=fallback, check=_xrefs_exist)
+
+    global PIPELINE
+
+    if args.writers:
+        PIPELINE = CommitPipeline(_commit, writers=args.writers, queue_size=args.queue_size)
+
+    try:
+        for bib in _prefetched(bibs, args.page_size, args.read_ahead):
+            i, last_id = i + 1, bib.id
+            result = _process_serial(bib, i, args, edits, committer, checkpoint, errors)
+            counts[result] += 1
+
+            if result == 'flushed':
+                status = ('\b' * len(status)) + f'Records updated: {committer.committed}'
+                print(status, end='', flush=True)
+            elif result == 'committed' and args.skip_confirm:
+                status = ('\b' * len(status)) + f'Records updated: {i}'
+                print(status, end='', flush=True)
+
+            if MEMORY:
+                MEMORY.check()
+
+            if PIPELINE and PIPELINE.errors:
+                # stop at the first failed commit, as when committing in the main thread
+                break
+    finally:
+        if PIPELINE:
+            pipeline, PIPELINE = PIPELINE, None
+            errors += pipeline.close()
+
+    if args.writers:
+        print(('\b' * len(status)) + f'Records updated: {pipeline.committed}', end='')
+
+        for _, message in errors:
+            print('\n' + message, end='')
+
+        if errors:
+            raise Exception(errors[0][1])
+
+    if committer:
+        committer.flush()
+        print(('\b' * len(status)) + f'Records updated: {committer.committed} ({committer.fallbacks} committed individually)', end='')
+
+    if checkpoint:
+        if last_id is not None:
+            # the records of the last batch are committed now
+            checkpoint.last_id = max(checkpoint.last_id or 0, last_id)
+
+        checkpoint.failed.update([x[0] for x in errors])
+        _save_checkpoint(checkpoint)
+
+    print('\n' + _summary(counts))
+    print(AUTH_CACHE.stats())
+
+def _process_serial(bib, i, args, edits, committer, checkpoint, errors):
+    """Process a record, recording it in the checkpoint if there is one"""
+    if not checkpoint:
+        return _process_record(bib, args, edits, committer)
+
+    # failures are recorded in the checkpoint instead of stopping the run
+    checkpoint.failed.discard(bib.id)
+
+    try:
+        result = _process_record(bib, args, edits, committer)
+    except Exception as e:
+        result = 'errors'
+        errors.append((bib.id, str(e)))
+        print(f'--> record id {bib.id}: {e}')
+
+    # don't move the checkpoint past records that are waiting to be bulk committed
+    if not (committer and committer.pending):
+        checkpoint.failed.update([x[0] for x in errors])
+        checkpoint.last_id = max(checkpoint.last_id or 0, bib.id)
+
+        if i % args.checkpoint_interval == 0:
+            _save_checkpoint(checkpoint)
+
+    return result
+
+def _save_checkpoint(checkpoint):
+    # make sure everything up to the checkpoint is on disk first
+    if isinstance(OUT, MrkWriter):
+        checkpoint.output_size = OUT.tell()
+    elif OUT:
+        OUT.flush()
+
+    checkpoint.save()
+
+def _commit_or_report(errors):
+    """BulkCommitter fallback that appends commit errors to `errors` instead of raising"""
+    def fallback(bib, last_edit):
+        try:
+            return _commit_with_reimport_retry(bib, last_edit)
+        except Exception as e:
+            errors.append((bib.id, str(e)))
+            print(f'--> record id {bib.id}: {e}')
+
+            return False
+
+    return fallback
+
+def _get_edits(dispatch='members', names=None, rules=None):
+    if rules and not names:
+        return [rules_edit(rules)]
+
+    if dispatch == 'registry':
+        # same order as members, so the results can be compared
+        edits = sorted(REGISTRY, key=lambda f: f.__name__)
+    else:
+        edits = [f for name, f in inspect.getmembers(sys.modules[__name__], inspect.isfunction) if name[:5] == 'edit_']
+
+    if names:
+        names = names.split(',')
+
+        if unknown := set(names) - {f.__name__ for f in edits}:
+            raise Exception(f'Unknown edit(s): {", ".join(sorted(unknown))}')
+
+        edits = [f for f in edits if f.__name__ in names]
+
+    if rules:
+        edits.append(rules_edit(rules))
+
+    return edits
+
+def _find(query, args, edits, sort=None):
+    kwargs = {'limit': args.limit}
+
+    if args.read_batch_size:
+        kwargs['batch_size'] = args.read_batch_size
+
+    if sort:
+        kwargs['sort'] = sort
+
+    if args.partial and (fields := projection(edits)):
+        kwargs['projection'] = fields
+
+    return BibSet.from_query(query, **kwargs)
+
+def _run_stage(name, f, bib, **kwargs):
+    """Run one stage of the pipeline on a bib, collecting its stats and timing if enabled"""
+    if STATS:
+        state = STATS.before(bib)
+
+    if REVIEW:
+        review_state = REVIEW.before(bib)
+
+    if TIMINGS:
+        start = time.perf_counter()
+
+    result = f(bib, **kwargs)
+
+    if TIMINGS:
+        TIMINGS.add(name, time.perf_counter() - start)
+
+    if STATS:
+        STATS.after(name, state, bib)
+
+    if REVIEW:
+        REVIEW.after(name, review_state, bib)
+
+    return result
+
+@contextmanager
+def _timed(name):
+    if not TIMINGS:
+        yield
+        return
+
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        TIMINGS.add(name, time.perf_counter() - start)
+
+def _edit_record(bib, edits, dispatch='members', normalize=False):
+    """Run the pre-edit steps and the edits on a bib.
+
+    With `normalize`, the indicator, subfield and tag rules of the edits in
+    `NORMALIZE_RULES` are applied in one pass over the fields after the other
+    edits, instead of by the edits themselves.
+
+    Returns the name of the last edit run, or None if the bib was skipped.
+    """
+    if STATS:
+        STATS.records += 1
+
+    # Normalize 991 from linked authority 191 before running individual edits.
+    _run_stage('_reimport_991_from_linked_auth_191', _reimport_991_from_linked_auth_191, bib)
+
+    # Re-import and validate linked subfields before the numbered edits run.
+    if not _run_stage('_preprocess_linked_subfields_before_edits', _preprocess_linked_subfields_before_edits, bib):
+        print(f'--> record id {bib.id}: skipped before edits (linked subfield precheck failed)')
+        return None
+
+    last_edit = 'pre-edit'
+
+    if dispatch == 'registry' or normalize:
+        # classify the record and index its tags once, instead of in every edit
+        types = record_types(bib)
+        tags = {field.tag for field in bib.fields}
+
+    skip = normalized_edits(edits) if normalize else ()
+
+    for edit in edits:
+        if edit.__name__ in skip:
+            continue
+
+        if dispatch == 'registry':
+            if not types <= edit.scope or (edit.tags and not edit.tags & tags):
+                continue
+
+            tags |= edit.adds
+
+        last_edit = edit.__name__
+
+        try:
+            bib = _run_stage(last_edit, edit, bib, types=types) if dispatch == 'registry' else _run_stage(last_edit, edit, bib)
+        except Exception as e:
+            raise Exception(f'Record {bib.id}: failed during {last_edit}: {e}') from e
+
+        if not isinstance(bib, Bib):
+            raise Exception('Edit function not returning a Bib object')
+
+    if normalize:
+        last_edit = 'normalize_fields'
+        table = normalize_table(tuple(edit.__name__ for edit in edits), types)
+        bib = _run_stage(last_edit, normalize_fields, bib, table=table)
+
+    return last_edit
+
+def _process_record(bib, args, edits, committer=None):
+    """Edit a bib and output or commit the changes.
+
+    Returns one of "skipped", "unchanged", "changed", "queued", "flushed",
+    "committed" or "disregarded".
+    """
+    if REVIEW:
+        REVIEW.start()
+
+    if not args.normalize:
         for field in bib.datafields:
             if field.ind1 == '_':
                 field.ind1 = ' '
@@ -125,99 +732,372 @@ def run(**kwargs):
             if field.ind2 == '_':
                 field.ind2 = ' '
 
-        before_edits = copy.deepcopy(bib)
-
-        # Normalize 991 from linked authority 191 before running individual edits.
-        _reimport_991_from_linked_auth_191(bib)
+    with _timed('snapshot'):
+        before_edits = Snapshot(bib)
 
-        # Re-import and validate linked subfields before the numbered edits run.
-        if not _preprocess_linked_subfields_before_edits(bib):
-            print(f'--> record id {bib.id}: skipped before edits (linked subfield precheck failed)')
-            continue
+    last_edit = _edit_record(bib, edits, args.dispatch, args.normalize)
 
-        last_edit = None
+    if last_edit is None:
+        return 'skipped'
 
-        for edit in edits:
-            last_edit = edit.__name__
-
-            try:
-                bib = edit(bib)
-            except Exception as e:
-                raise Exception(f'Record {bib.id}: failed during {last_edit}: {e}') from e
+    with _timed('diff'):
+        changed = before_edits.changed(bib)
 
-            if not isinstance(bib, Bib):
-                raise Exception('Edit function not returning a Bib object')
-        
+    if changed:
+        # only stamp the records the edits changed, so the 999 doesn't make every record a write
         initials = args.initials if args.initials else 'js'
         if len(initials) > 2:
             initials = initials[:2]
-        bib = add_999(bib, initials)
-            
-        if changes := '\n'.join([f.to_mrk() for f in Diff(before_edits, bib).a]):
-            if args.view_changes:
-                if args.output == 'mrk':
-                    OUT.write(f'--> record id {bib.id}\nFields changed:\n{changes}\n\nRecord with changes:\n')
-                else:
-                    print(f'--> record id {bib.id}\nFields changed:\n{changes}\n\nRecord with changes:\n')
+        bib = add_999(bib, initials, args.stamp_date)
+
+        if args.view_changes:
+            changes = '\n'.join([f.to_mrk() for f in before_edits.removed(bib)])
 
             if args.output == 'mrk':
+                OUT.write(f'--> record id {bib.id}\nFields changed:\n{changes}\n\nRecord with changes:\n')
+            else:
+                print(f'--> record id {bib.id}\nFields changed:\n{changes}\n\nRecord with changes:\n')
+
+        if args.output == 'mrk':
+            with _timed('output'):
                 OUT.write(bib.to_mrk() + '\n')
-            elif args.output == 'db':
-                if args.skip_confirm:
-                    _commit_with_reimport_retry(bib, last_edit)
+        elif args.output == 'plan':
+            with _timed('output'):
+                patch = changeset.patch(bib, before_edits, last_edit)
 
-                    status = ('\b' * len(status)) + f'Records updated: {i}'
-                    print(status, end='', flush=True)
-                else:
-                    x = input(f'{bib.to_mrk()}\nCommit changes? (y/n): ')
+                if REVIEW:
+                    patch['groups'] = REVIEW.finish(bib.id)
 
-                    if x.lower() != 'y':
-                        print('Changes disregarded\n')
-                        time.sleep(1)
-                        continue
+                OUT.write(json.dumps(patch) + '\n')
+        elif args.output == 'db':
+            if committer:
+                with _timed('commit'):
+                    return 'flushed' if committer.add(bib, last_edit) else 'queued'
+            elif args.skip_confirm:
+                with _timed('commit'):
+                    if PIPELINE:
+                        PIPELINE.submit(bib, before_edits, last_edit, args)
 
-                    _commit_with_reimport_retry(bib, last_edit)
+                        return 'queued'
 
-                    print(f'OK. Updated {bib.id}\n')
-                    time.sleep(1)
-        else:
-            print(f'--> record id {bib.id}: No changes')
+                    _commit(bib, before_edits, last_edit, args)
+
+                return 'committed'
+            else:
+                x = input(f'{bib.to_mrk()}\nCommit changes? (y/n): ')
+
+                if x.lower() != 'y':
+                    print('Changes disregarded\n')
+                    
+                    return 'disregarded'
+
+                _commit(bib, before_edits, last_edit, args)
+
+                print(f'OK. Updated {bib.id}\n')
+
+                return 'committed'
+
+        return 'changed'
+    else:
+        print(f'--> record id {bib.id}: No changes')
+
+        return 'unchanged'
+
+def _summary(counts):
+    changed = sum(counts[x] for x in ('changed', 'queued', 'flushed', 'committed', 'disregarded'))
+    summary = f'Records processed: {sum(counts.values())}; changed: {changed}; unchanged: {counts["unchanged"]}; skipped: {counts["skipped"]}'
+
+    if counts['errors']:
+        summary += f'; errors: {counts["errors"]}'
+
+    return summary
+
+### parallel processing
+
+def _id_ranges(query, n):
+    """Split the `_id`s of the bibs matching `query` into at most `n` contiguous [start, end) ranges"""
+    first = next(DB.bibs.find(query, {'_id': 1}).sort('_id', 1).limit(1), None)
+    last = next(DB.bibs.find(query, {'_id': 1}).sort('_id', -1).limit(1), None)
+
+    if first is None:
+        return []
+
+    start, end = first['_id'], last['_id'] + 1
+    step = -(-(end - start) // n)
+
+    return [(x, min(x + step, end)) for x in range(start, end, step)]
+
+def _shard_query(query, id_range):
+    id_query = {'_id': {'$gte': id_range[0], '$lt': id_range[1]}}
+
+    return {'$and': [query, id_query]} if query else id_query
+
+def _run_shard(params, user, query, id_range):
+    """Process pool worker. Edits the bibs in one `_id` range using its own DB connection.
+
+    Returns the counts, the output and log text of each record in `_id` order,
+    a list of (record id, error message), the EditStats and Timings if enabled,
+    and the auth cache hits and misses. Without a checkpoint, every shard
+    stops at the first failed record of any shard, as the serial run does.
+    """
+    global USER, AUTH_CACHE, OUT, STATS, TIMINGS, PIPELINE, MEMORY
+    args = Namespace(**params)
+    USER = user
+    STATS = EditStats() if args.output == 'stats' else None
+    TIMINGS = Timings() if args.timings or args.timings_file else None
+    DB.connect(args.connect, database=args.database)
+    AUTH_CACHE = _auth_cache(args)
+    MEMORY = _memory_monitor(args)
+    edits = _get_edits(args.dispatch, args.edits, args.rules)
+    counts, results, errors = Counter(), [], []
+    committer = None
+
+    if args.output == 'db' and args.batch_size:
+        committer = BulkCommitter(USER, batch_size=args.batch_size, fallback=_commit_or_report(errors), check=_xrefs_exist)
+
+    if args.writers:
+        PIPELINE = CommitPipeline(_commit, writers=args.writers, queue_size=args.queue_size)
+
+    bibs = _find(_shard_query(query, id_range), args, edits, sort=[('_id', 1)])
+
+    for bib in _prefetched(bibs, args.page_size, args.read_ahead):
+        if STOP is not None and STOP.is_set():
+            break
+
+        OUT, log = io.StringIO(), io.StringIO()
+
+        try:
+            with redirect_stdout(log):
+                counts[_process_record(bib, args, edits, committer)] += 1
+        except Exception as e:
+            counts['errors'] += 1
+            errors.append((bib.id, str(e)))
+
+        results.append((bib.id, OUT.getvalue(), log.getvalue()))
+
+        if MEMORY:
+            MEMORY.check()
+
+        if not args.checkpoint and (errors or (PIPELINE and PIPELINE.errors)):
+            if STOP is not None:
+                STOP.set()
+
+            break
+
+    # the queued records aren't committed once the run has failed
+    if committer and not (STOP is not None and STOP.is_set()):
+        log = io.StringIO()
+
+        with redirect_stdout(log):
+            committer.flush()
+
+        results.append((None, '', log.getvalue()))
+
+    if PIPELINE:
+        pipeline_errors, PIPELINE = PIPELINE.close(), None
+        errors += pipeline_errors
+        counts['errors'] += len(pipeline_errors)
+
+    return counts, results, errors, STATS, TIMINGS, (AUTH_CACHE.hits, AUTH_CACHE.misses)
+
+def _init_shard(stop):
+    """Process pool initializer. Shares the event set by the first shard that fails"""
+    global STOP
+    STOP = stop
+
+def _run_parallel(args, query, checkpoint=None):
+    """Run the edits in a process pool, one `_id` range per task"""
+    if args.limit:
+        raise Exception('--limit is not supported with --workers')
+
+    if args.output == 'db' and not args.skip_confirm:
+        raise Exception('--workers requires --skip_confirm when output is db')
+
+    ranges = _id_ranges(query, args.workers * 4)
+    counts, errors = Counter(), []
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_shard, initargs=(multiprocessing.Event(),)) as pool:
+        # results come back in shard order, so output stays in _id order
+        shards = pool.map(_run_shard, repeat(vars(args)), repeat(USER), repeat(query), ranges)
+
+        for id_range, (shard_counts, results, shard_errors, shard_stats, shard_timings, (hits, misses)) in zip(ranges, shards):
+            counts.update(shard_counts)
+            errors += shard_errors
+            AUTH_CACHE.hits += hits
+            AUTH_CACHE.misses += misses
+
+            if shard_stats:
+                STATS.merge(shard_stats)
+
+            if shard_timings:
+                TIMINGS.merge(shard_timings)
+
+            for _, out, log in results:
+                if out:
+                    OUT.write(out)
+
+                sys.stdout.write(log)
+
+            if checkpoint:
+                # shards are returned in order, so everything below the end of this range is done
+                checkpoint.last_id = id_range[1] - 1
+                failed = {x[0] for x in shard_errors}
+                # failed ids retried by this shard are done if they didn't fail again
+                checkpoint.failed -= {_id for _id, _, _ in results if _id is not None} - failed
+                checkpoint.failed |= failed
+                _save_checkpoint(checkpoint)
+
+    errors.sort(key=lambda x: x[0])
+
+    for _, message in errors:
+        print(message)
+
+    print('\n' + _summary(counts))
+    print(AUTH_CACHE.stats())
+
+    if errors and not checkpoint:
+        raise Exception(errors[0][1])
+
+### edit registry
+
+BIBLIOGRAPHIC, SPEECHES, VOTING = 'bibliographic', 'speeches', 'voting'
+ALL = (BIBLIOGRAPHIC, SPEECHES, VOTING)
+REGISTRY = []
+
+def record_types(bib):
+    """The set of record types of a bib, from 989$a"""
+    values = bib.get_values('989', 'a')
+    types = {t for t, value in ((SPEECHES, 'Speeches'), (VOTING, 'Voting Data')) if value in values}
+
+    return frozenset(types or [BIBLIOGRAPHIC])
+
+def edit(scope=ALL, tags=None, adds=(), reads=(), prefilter=None):
+    """Register an edit function.
+
+    The edit only runs on records whose types are all in `scope`. `tags` are
+    the tags the edit acts on, `adds` the tags it may create and `reads` any
+    other tags it needs. With `dispatch='registry'` the edit is skipped for
+    records without any of `tags`.
+
+    `prefilter` is a MDB query matching every record the edit could change.
+    It defaults to the existence of any of `tags`.
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(bib, types=None):
+            if (types or record_types(bib)) <= wrapper.scope:
+                return f(bib)
+
+            return bib
+
+        wrapper.scope = frozenset([scope] if isinstance(scope, str) else scope)
+        wrapper.tags = frozenset(tags) if tags else None
+        wrapper.adds = frozenset(adds)
+        wrapper.reads = frozenset(reads)
+        wrapper.prefilter = prefilter if prefilter is not None else _tags_exist(*tags) if tags else None
+        REGISTRY.append(wrapper)
+
+        return wrapper
+
+    return decorator
+
+def rules_edit(path):
+    """An edit applying the rules in the JSON file at `path`, with the same attributes as the registered edits"""
+    rules = RuleSet.load(path, types=ALL)
+
+    def wrapper(bib, types=None):
+        return rules.apply(bib, types or record_types(bib))
+
+    wrapper.__name__ = f'rules:{os.path.basename(path)}'
+    wrapper.scope = frozenset(ALL)
+    wrapper.tags = rules.tags
+    wrapper.adds = rules.adds
+    wrapper.reads = frozenset()
+    wrapper.prefilter = _tags_exist(*sorted(rules.tags)) if rules.tags else None
+
+    return wrapper
+
+def prefilter_query(edits):
+    """MDB query matching the records that at least one of `edits` could change.
+
+    Returns None if any of the edits can't be prefiltered.
+    """
+    # 991 is replaced from the linked auths before the edits run
+    clauses = [_tags_exist('991')]
+
+    for edit in edits:
+        if edit.prefilter is None:
+            return None
+
+        clauses.append(edit.prefilter)
+
+    return {'$or': clauses}
+
+def projection(edits):
+    """MDB projection of the fields needed to run `edits` and commit the changes.
+
+    Returns None if any of the edits can apply to every tag.
+    """
+    # record type, linked auth 191 and the 999 stamp
+    tags = {'989', '991', '999'}
+
+    for edit in edits:
+        if edit.tags is None:
+            return None
+
+        tags |= edit.tags | edit.adds | edit.reads
+
+    return dict({tag: True for tag in sorted(tags)}, updated=True, user=True)
+
+def _tags_exist(*tags):
+    return {'$or': [{tag: {'$exists': True}} for tag in tags]}
+
+def _indicators_set(*tags):
+    # "_" indicators are normalized before the edits and don't count as changes
+    return {'$or': [{tag: {'$elemMatch': {'indicators': {'$elemMatch': {'$nin': [' ', '_']}}}}} for tag in tags]}
+
+def _subfields_exist(*pairs):
+    return {'$or': [{f'{tag}.subfields.code': code} for tag, code in pairs]}
+
+INDICATOR_TAGS = ('022', '041', '239', '245', '246', '362', '490', '505', '520', '597', '600', '610', '611', '630', '700', '710', '711', '730', '740', '767', '780', '785', '830')
+DELETE_930 = Pattern('a', prefixes=('UND', 'UNP', 'UNGREY', 'CIF', 'DIG', 'HUR', 'PER', 'PN'), negate=True)
+TAG_MOVES = {'100': '700', '110': '710', '111': '711', '130': '730', '440': '830'}
+SUBFIELD_PAIRS = [('041', 'b'), ('099', 'q'), ('191', 'f'), ('250', 'b'), ('520', 'b'), ('520', '9'), ('600', '2'), ('610', '2'), ('611', '2'), ('630', '2'), ('650', '2')]
 
 ###
 
 # delete_field
+@edit(scope=BIBLIOGRAPHIC, tags=('099',))
 def edit_1(bib):
     # 1. BIBLIOGRAPHIC - Delete field 099 - IF subfield c is empty OR if subfield c = internet
-    if not any([x == 'Speeches' or x == 'Voting Data' for x in bib.get_values('989', 'a')]):
-        [bib.delete_field(field) for field in bib.get_fields('099') if field.get_value('c').lower() == 'internet']
-        [bib.delete_field(field) for field in bib.get_fields('099') if not field.get_value('c')]
+    [bib.delete_field(field) for field in bib.get_fields('099') if field.get_value('c').lower() == 'internet']
+    [bib.delete_field(field) for field in bib.get_fields('099') if not field.get_value('c')]
 
     return bib
 
 # delete_field   
+@edit(scope=BIBLIOGRAPHIC, tags=('029',))
 def edit_2(bib):
     # 2. BIBLIOGRAPHIC - Delete field 029 - IF subfield a IS NOT JN or UN
-    if not any([x == 'Speeches' or x == 'Voting Data' for x in bib.get_values('989', 'a')]):
-        [bib.delete_field(field) for field in bib.get_fields('029') if field.get_value('a') not in ('JN', 'UN')]
+    [bib.delete_field(field) for field in bib.get_fields('029') if field.get_value('a') not in ('JN', 'UN')]
 
     return bib
 
 # delete_field
+@edit(scope=ALL, tags=('930',))
 def edit_3(bib):
     # 3. BIBLIOGRAPHIC, SPEECHES, VOTING - Delete field 930 - If NOT 930:UND* OR 930:UNGREY* OR 930:CIF* OR 930:DIG* OR 930:HUR* OR 930:PER* OR 930:PN*
-    for field in bib.get_fields('930'):
-        if not any([re.match(f'^{x}', field.get_value('a')) for x in ('UND', 'UNP', 'UNGREY', 'CIF', 'DIG', 'HUR', 'PER', 'PN')]):
-            bib.fields = [f for f in bib.fields if f != field] # todo: fix dlx.Marc.delete_field with field as arg # 2025-11-4 this may be done?
-
-    return bib  
+    return delete_fields(bib, '930', DELETE_930)
 
 # delete_field        
+@edit(scope=ALL, tags=('000',))
 def edit_4(bib):
     # 4. BIBLIOGRAPHIC, SPEECHES, VOTING - Delete field 000 - No condition
     bib.delete_fields('000')
     return bib
 
 # delete_field
+@edit(scope=ALL, tags=('008',))
 def edit_5(bib):
     # 5. BIBLIOGRAPHIC - Delete field 008 - No condition
     # update: delete for all record types
@@ -227,111 +1107,111 @@ def edit_5(bib):
     return bib
 
 # delete_field
+@edit(scope=(BIBLIOGRAPHIC, VOTING), tags=('035',))
 def edit_6(bib):
     # 6. BIBLIOGRAPHIC, VOTING - Delete field 035 - IF 089__b is NOT B22 (keep 035 for speeches)
-    if not any([x == 'Speeches' for x in bib.get_values('989', 'a')]):
-        bib.delete_fields('035')
+    bib.delete_fields('035')
 
     return bib
 
 # delete_field
+@edit(scope=BIBLIOGRAPHIC, tags=('069',))
 def edit_7(bib):
     # 7. BIBLIOGRAPHIC - Delete field 069 - No condition
-    if not any([x == 'Speeches' or x == 'Voting Data' for x in bib.get_values('989', 'a')]):
-        bib.delete_fields('069')
+    bib.delete_fields('069')
 
     return bib
 
 # change_tag
+@edit(scope=BIBLIOGRAPHIC, tags=tuple(TAG_MOVES), adds=tuple(TAG_MOVES.values()))
 def edit_8_9_10_11_14(bib):
     # 8. BIBLIOGRAPHIC - Transfer field 100 - to 700 - Clean indicators before transfer
     # 9. BIBLIOGRAPHIC - Transfer field 110 - to 710 - Clean indicators before transfer
     # 10. BIBLIOGRAPHIC - Transfer field 111 - to 711 - Clean indicators before transfer
     # 11. BIBLIOGRAPHIC - Transfer field 130 - to 730 - Clean indicators before transfer
     # 14. BIBLIOGRAPHIC - Transfer field 440 - To 830 - Clean indicators before transfer
-    if not any([x == 'Speeches' or x == 'Voting Data' for x in bib.get_values('989', 'a')]):
-        for from_tag, to_tag in [('100', '700'), ('110', '710'), ('111', '711'), ('130', '730'), ('440', '830')]:
-            for field in bib.get_fields(from_tag):
-                field.ind1, field.ind1 = ' ', ' '
-
-            bib = change_tag(bib, from_tag, to_tag)
+    for field in bib.datafields:
+        if to_tag := TAG_MOVES.get(field.tag):
+            field.ind1 = ' '
+            field.tag = to_tag
 
     return bib
 
 # delete_field
+@edit(scope=BIBLIOGRAPHIC, tags=('222',))
 def edit_12(bib):
     # 12. BIBLIOGRAPHIC - Delete field 222 - No condition
-    if not any([x == 'Speeches' or x == 'Voting Data' for x in bib.get_values('989', 'a')]):
-        bib.delete_fields('222')
+    bib.delete_fields('222')
 
     return bib
 
 # delete_field
+@edit(scope=(SPEECHES, VOTING), tags=('269',))
 def edit_13(bib):
     # 13. VOTING, SPEECHES - Delete field 269 - If (089:B22 OR  089:B23) - Only speeches and votes
-    if any([x == 'Speeches' or x == 'Voting Data' for x in bib.get_values('989', 'a')]):
-        bib.delete_fields('269')
+    bib.delete_fields('269')
 
     return bib
 
 # no function
+@edit(scope=BIBLIOGRAPHIC, tags=('490',), adds=('022',))
 def edit_15(bib):
     # 15. BIBLIOGRAPHIC - Transfer field 490 $x - Transfer to 022 $a if the field with the same value does not exists
-    if not any([x == 'Speeches' or x == 'Voting Data' for x in bib.get_values('989', 'a')]):
-        for field in bib.get_fields('490'):
-            val = field.get_value('x')
+    for field in bib.get_fields('490'):
+        val = field.get_value('x')
 
-            if val not in bib.get_values('022', 'a'):
-                bib.set('022', 'a', val, address='+')
+        if val and val not in bib.get_values('022', 'a'):
+            bib.set('022', 'a', val, address='+')
             
-            field.subfields = [s for s in field.subfields if s.code != 'x']
+        field.subfields = [s for s in field.subfields if s.code != 'x']
 
     return bib
 
 # delete_field
+@edit(scope=BIBLIOGRAPHIC, tags=('597',))
 def edit_16(bib):
     # 16. BIBLIOGRAPHIC - Delete field 597 - If 597:"Retrospective indexing"
 
     # skip for now
     return bib
 
-    if not any([x == 'Speeches' or x == 'Voting Data' for x in bib.get_values('989', 'a')]):
-        for field in bib.get_fields('597'):
-            if field.get_value('a').lower()[:22] == 'retrospective indexing':
-                bib.delete_field(field)
+    for field in bib.get_fields('597'):
+        if field.get_value('a').lower()[:22] == 'retrospective indexing':
+            bib.delete_field(field)
 
     return bib
 
 # delete_field
+@edit(scope=BIBLIOGRAPHIC, tags=('773',), adds=('580',))
 def edit_17(bib):
     # 17. BIBLIOGRAPHIC - Delete field 773 - No condition
     # amendment: move to 580
-    if not any([x == 'Speeches' or x == 'Voting Data' for x in bib.get_values('989', 'a')]):
-        for field in bib.get_fields('773'):
-            field.ind1, field.ind2 = ' ', ' '
-            field.tag = '580'
+    for field in bib.get_fields('773'):
+        field.ind1, field.ind2 = ' ', ' '
+        field.tag = '580'
 
-        bib.delete_fields('773')
+    bib.delete_fields('773')
 
     return bib
 
 # delete_field
+@edit(scope=BIBLIOGRAPHIC, tags=('910',))
 def edit_18(bib):
     # 18. BIBLIOGRAPHIC - Delete field 910 - No conditions
-    if not any([x == 'Speeches' or x == 'Voting Data' for x in bib.get_values('989', 'a')]):
-        bib.delete_fields('910')
+    bib.delete_fields('910')
 
     return bib
 
 # delete_field
+@edit(scope=BIBLIOGRAPHIC, tags=('920',))
 def edit_19(bib):
     # 19. BIBLIOGRAPHIC - Delete field 920 - No condition
-    if not any([x == 'Speeches' or x == 'Voting Data' for x in bib.get_values('989', 'a')]):
-        bib.delete_fields('920')
+    bib.delete_fields('920')
 
     return bib
 
 # delete_field
+@edit(scope=ALL, tags=('949',))
 def edit_20(bib):
     # 20. BIBLIOGRAPHIC - Delete field 949 - TO COMPLETE AFTER DECISION
     # update: go ahead
@@ -340,22 +1220,23 @@ def edit_20(bib):
     return bib
 
 # delete_field
+@edit(scope=BIBLIOGRAPHIC, tags=('955',))
 def edit_21(bib):
     # 21. BIBLIOGRAPHIC - Delete field 955 - No condition
-    if not any([x == 'Speeches' or x == 'Voting Data' for x in bib.get_values('989', 'a')]):
-        bib.delete_fields('955')
+    bib.delete_fields('955')
 
     return bib
 
 # delete_field
+@edit(scope=BIBLIOGRAPHIC, tags=('995',))
 def edit_22(bib):
     # 22. BIBLIOGRAPHIC - Delete field 995 - No condition
-    if not any([x == 'Speeches' or x == 'Voting Data' for x in bib.get_values('989', 'a')]):
-        bib.delete_fields('995')
+    bib.delete_fields('995')
 
     return bib
 
 # delete_indicators
+@edit(scope=ALL, tags=INDICATOR_TAGS, prefilter=_indicators_set(*INDICATOR_TAGS))
 def edit_23_34_36_42(bib):
     # 23. BIBLIOGRAPHIC, VOTING, SPEECHES - Delete indicators 022 - No condition
     # 24. BIBLIOGRAPHIC, VOTING, SPEECHES - Delete indicators 041 - No conditions
@@ -381,9 +1262,7 @@ def edit_23_34_36_42(bib):
     # 43.2 BIBLIOGRAPHIC, VOTING, SPEECHES - Delete indicators 785 - No conditions
     # 43.3 BIBLIOGRAPHIC, VOTING, SPEECHES - Delete indicators 362 - No conditions
     # 43.4 BIBLIOGRAPHIC, VOTING, SPEECHES - Delete indicators 490 - No conditions
-    tags = ('022', '041', '239', '245', '246', '362', '490', '505', '520', '597', '600', '610', '611', '630', '700', '710', '711', '730', '740', '767', '780', '785', '830')
-    
-    for tag in tags:
+    for tag in INDICATOR_TAGS:
         for field in bib.get_fields(tag):
             field.ind1 = ' ' if field.ind1 not in (' ', '_') else field.ind1
             field.ind2 = ' ' if field.ind2 not in (' ', '_') else field.ind2
@@ -391,6 +1270,7 @@ def edit_23_34_36_42(bib):
     return bib
 
 # delete_subfield
+@edit(scope=ALL, tags=('040',), prefilter=_subfields_exist(('040', 'b')))
 def edit_43(bib):
     # 43. BIBLIOGRAPHIC, SPEECHES, VOTING - Delete subfield 040 $b - No conditions
     for field in bib.get_fields('040'):
@@ -399,15 +1279,16 @@ def edit_43(bib):
     return bib
 
 # delete_subfield
+@edit(scope=BIBLIOGRAPHIC, tags=('079',), prefilter=_subfields_exist(('079', 'q')))
 def edit_44(bib):
     # 44. BIBLIOGRAPHIC - Delete subfield 079 $q - No condition
-    if not any([x == 'Speeches' or x == 'Voting Data' for x in bib.get_values('989', 'a')]):
-        for field in bib.get_fields('079'):
-            field.subfields = [x for x in field.subfields if x.code != 'q']
+    for field in bib.get_fields('079'):
+        field.subfields = [x for x in field.subfields if x.code != 'q']
 
     return bib
 
 # delete_subfield
+@edit(scope=ALL, tags=('089',), prefilter=_subfields_exist(('089', 'a')))
 def edit_45(bib):
     # 45. BIBLIOGRAPHIC, SPEECHES, VOTING - Delete subfield 089 $a - IF 089__a IS NOT "veto"
     for field in bib.get_fields('089'):
@@ -416,6 +1297,7 @@ def edit_45(bib):
     return bib
 
 # delete_subfield
+@edit(scope=BIBLIOGRAPHIC, tags=tuple(tag for tag, _ in SUBFIELD_PAIRS), prefilter=_subfields_exist(*SUBFIELD_PAIRS))
 def edit_46_53(bib):
     # 46. BIBLIOGRAPHIC - Delete subfield 099 $q - No condition
     # 47. BIBLIOGRAPHIC - Delete subfield 191 $f - No condition
@@ -427,38 +1309,36 @@ def edit_46_53(bib):
     # 53.1 BIBLIOGRAPHIC - Delete subfield 041 $b - No condition
     # 53.2 BIBLIOGRAPHIC - Delete subfield 520 $b - No condition
     # 53.3 BIBLIOGRAPHIC - Delete subfield 520 $9 - No condition
-    pairs = [('041', 'b'), ('099', 'q'), ('191', 'f'), ('250', 'b'), ('520', 'b'), ('520', '9'), ('600', '2'), ('610', '2'), ('611', '2'), ('630', '2'), ('650', '2')]
-
-    if not any([x == 'Speeches' or x == 'Voting Data' for x in bib.get_values('989', 'a')]):
-        for tag, code in pairs:
-            for field in bib.get_fields(tag):
-                field.subfields = [x for x in field.subfields if x.code != code]
+    for tag, code in SUBFIELD_PAIRS:
+        for field in bib.get_fields(tag):
+            field.subfields = [x for x in field.subfields if x.code != code]
 
     return bib
 
 # no function
+@edit(scope=BIBLIOGRAPHIC, tags=('250',), prefilter=_subfields_exist(('250', 'b')))
 def edit_48(bib):
     # 48. BIBLIOGRAPHIC - Delete subfield 250 $b - No condition
     # need to strip the = at the end of subfield $a
-    if not any([x == 'Speeches' or x == 'Voting Data' for x in bib.get_values('989', 'a')]):
-        for field in bib.get_fields('250'):
-            if field.get_subfield('b'):
-                field.subfields = [x for x in field.subfields if x.code != 'b']
+    for field in bib.get_fields('250'):
+        if field.get_subfield('b'):
+            field.subfields = [x for x in field.subfields if x.code != 'b']
 
-                if field.get_subfield('a').value[-1] == '=':
-                    field.get_subfield('a').value = field.get_subfield('a').value[:-1]
+            if field.get_subfield('a').value[-1] == '=':
+                field.get_subfield('a').value = field.get_subfield('a').value[:-1]
 
     return bib
 
 # delete_subfield
+@edit(scope=(BIBLIOGRAPHIC, SPEECHES), tags=('710',), prefilter=_subfields_exist(('710', '9')))
 def edit_54(bib):
     # 54. BIBLIOGRAPHIC, SPEECHES - Delete subfield 710 $9 - No conditions
-    if not any([x == 'Voting Data' for x in bib.get_values('989', 'a')]):
-        for field in bib.get_fields('710'):
-            field.subfields = [x for x in field.subfields if x.code != '9']
+    for field in bib.get_fields('710'):
+        field.subfields = [x for x in field.subfields if x.code != '9']
     
     return bib
 
+@edit(scope=ALL, tags=('650',), reads=('269',), prefilter=_indicators_set('650'))
 def edit_55(bib):
     # NEW: BIBLIOGRAPHIC, VOTING, SPEECHES, BIBLIOGRAPHIC - Delete indicators 650 - if 269$a < 2014 delete ind2 else delete both
     date = bib.get_value('269', 'a')
@@ -478,10 +1358,10 @@ def edit_55(bib):
     return bib
 
 # delete field
+@edit(scope=BIBLIOGRAPHIC, tags=('529',))
 def edit_56(bib):
     # NEW: BIBLIOGRAPHIC - Delete field 529 - no condition
-    if not any([x == 'Speeches' or x == 'Voting Data' for x in bib.get_values('989', 'a')]):
-        bib.delete_fields('529')
+    bib.delete_fields('529')
 
     return bib
 
@@ -504,7 +1384,7 @@ def _reimport_subfields_from_auth(field, include_non_none=False):
         if not xref:
             continue
 
-        looked_up = Auth.lookup(xref, sub.code)
+        looked_up = AUTH_CACHE.lookup(xref, sub.code)
 
         if looked_up is not None:
             try:
@@ -523,7 +1403,7 @@ def _reimport_tag_and_validate_required_subfield(
     """Re-import linked values for a tag and ensure required subfield isn't None."""
     def _lookup_required(sub):
         xref = getattr(sub, 'xref', None)
-        return Auth.lookup(xref, required_subfield_code) if xref else None
+        return AUTH_CACHE.lookup(xref, required_subfield_code) if xref else None
 
     invalid_xrefs = reimport_and_find_invalid_xrefs(bib, tag=tag)
 
@@ -559,7 +1439,7 @@ def _reimport_tag_and_validate_required_subfield(
             for sub in none_required:
                 xref = getattr(sub, 'xref', None) or fallback_xref
 
-                if xref and Auth.lookup(xref, required_subfield_code) is not None:
+                if xref and AUTH_CACHE.lookup(xref, required_subfield_code) is not None:
                     linked_auth_missing_required = False
                     break
 
@@ -641,7 +1521,7 @@ def _reimport_991_from_linked_auth_191(bib):
     bib.delete_fields('991')
 
     for xref in xrefs:
-        auth = Auth.from_query({'_id': xref})
+        auth = AUTH_CACHE.get(xref)
 
         if not auth:
             continue
@@ -667,6 +1547,7 @@ def _reimport_991_from_linked_auth_191(bib):
 
     return bib
 
+@edit(scope=ALL, tags=('600', '610', '700'))
 def edit_57(bib):
     # BIBLIOGRAPHIC - Re-import None subfield values via xref before logging/skipping
     for tag in ('600', '610', '700'):
@@ -681,6 +1562,7 @@ def edit_57(bib):
 
     return bib
 
+@edit(scope=ALL, tags=('611',))
 def edit_58(bib):
     # BIBLIOGRAPHIC - Re-import None subfield values via xref before logging/skipping
     if not _reimport_tag_and_validate_required_subfield(
@@ -697,6 +1579,7 @@ def edit_58(bib):
 
     return bib
 
+@edit(scope=ALL, tags=('191',))
 def edit_59(bib):
     # BIBLIOGRAPHIC - Re-import None subfield values via xref before logging/skipping
     if not _reimport_tag_and_validate_required_subfield(bib, '191', 'c', 'edit_59'):
@@ -704,81 +1587,128 @@ def edit_59(bib):
 
     return bib
 
+### single-pass field normalization
+
+# The indicator, subfield and tag rules of these edits are applied by `normalize_fields`
+# instead, after the other edits have run
+NORMALIZE_RULES = {
+    'edit_23_34_36_42': {'clear_indicators': INDICATOR_TAGS},
+    'edit_43': {'delete_subfields': [('040', 'b')]},
+    'edit_44': {'delete_subfields': [('079', 'q')]},
+    'edit_46_53': {'delete_subfields': SUBFIELD_PAIRS},
+    'edit_54': {'delete_subfields': [('710', '9')]},
+    'edit_8_9_10_11_14': {'move': TAG_MOVES.items()},
+}
+
+# edit_46_53 deletes 250$b before edit_48 runs, so edit_48 never changes a record when both run
+SUPERSEDED = {'edit_48': 'edit_46_53'}
+
+def normalized_edits(edits):
+    """The names of `edits` that `normalize_fields` replaces"""
+    names = {edit.__name__ for edit in edits}
+
+    return {name for name in names if name in NORMALIZE_RULES or SUPERSEDED.get(name) in names}
+
+@functools.lru_cache(maxsize=None)
+def normalize_table(names, types):
+    """{tag: (clear indicators, subfield codes to delete, tag to move to)}
+
+    Built from the rules of the edits in `names` that apply to records of `types`.
+    The rules for a field are those of its tag before any move, as each edit
+    only sees the tags as they were when it ran.
+    """
+    scopes = {edit.__name__: edit.scope for edit in REGISTRY}
+    table = {}
+
+    for name in names:
+        rules = NORMALIZE_RULES.get(name)
+
+        if rules is None or not types <= scopes[name]:
+            continue
+
+        for tag in rules.get('clear_indicators', ()):
+            table.setdefault(tag, [False, set(), None])[0] = True
+
+        for tag, code in rules.get('delete_subfields', ()):
+            table.setdefault(tag, [False, set(), None])[1].add(code)
+
+        for from_tag, to_tag in rules.get('move', ()):
+            table.setdefault(from_tag, [False, set(), None])[2] = to_tag
+
+    return {tag: (clear, frozenset(codes), move) for tag, (clear, codes, move) in table.items()}
+
+def normalize_fields(bib, table):
+    """Replace "_" indicators and apply the rules in `table`, visiting each datafield once"""
+    for field in bib.datafields:
+        if field.ind1 == '_':
+            field.ind1 = ' '
+
+        if field.ind2 == '_':
+            field.ind2 = ' '
+
+        if (rule := table.get(field.tag)) is None:
+            continue
+
+        clear, codes, move = rule
+
+        if clear:
+            field.ind1, field.ind2 = ' ', ' '
+
+        if codes:
+            field.subfields = [x for x in field.subfields if x.code not in codes]
+
+        if move:
+            # as edit_8_9_10_11_14, which only clears the first indicator
+            field.ind1 = ' '
+            field.tag = move
+
+    return bib
+
 # add 999
 '''
 Takes the 999 addition out of the regular edits so that initials can be passed in from command line
 '''
-def add_999(bib, initials='js'):
+def add_999(bib, initials='js', date=None):
     # NEW: ALL - Add 999
-    date = datetime.now().astimezone(timezone('US/Eastern')).strftime(r'%Y%m%d')
+    date = date or _eastern_date()
     field = Datafield('999', record_type='bib')
     field.set('a', f'{initials}b{date}').set('b', date).set('c', 'b')
     bib.fields.append(field)
 
     return bib
 
-### future - abstracted functions
+def _eastern_date():
+    return datetime.now().astimezone(timezone('US/Eastern')).strftime(r'%Y%m%d')
+
+### abstracted functions, see batch_edits.rules
 
 def change_value():
     pass
 
 def delete_field(record, tag, conditions=[]):
-    if conditions:
-        assert all([isinstance(c, Condition) for c in conditions])
-
-        for field in record.get_fields(tag):
-            for subfields in [x.subfields for x in conditions]:
-                for code, val in subfields:
-                    if val in field.get_values(code):
-                        record.delete_field(field)
-    else:
-        record.delete_field(tag)
-
-    return record
+    return _apply_rule(record, {'action': 'delete_field', 'tag': tag}, conditions)
 
 def change_tag(record, from_tag, to_tag, conditions=[]):
-        assert all([isinstance(c, Condition) for c in conditions]) if conditions else True
-
-        for field in record.get_fields(from_tag):
-            if conditions:
-                for subfields in [x.subfields for x in conditions]:
-                    for code, val in subfields:
-                        if val in field.get_values(code):
-                            field.tag = to_tag
-            else:
-                field.tag = to_tag
-
-        return record
+    return _apply_rule(record, {'action': 'change_tag', 'tag': from_tag, 'to': to_tag}, conditions)
 
 def delete_indicators(record, tag, conditions=[]):
-    if conditions:
-        assert all([isinstance(c, Condition) for c in conditions])
-
-        for field in record.get_fields(tag):
-            for subfields in [x.subfields for x in conditions]:
-                for code, val in subfields:
-                    if val in field.get_values(code):
-                        field.ind1, field.ind2 = [' ', ' ']
-
-    return record
+    return _apply_rule(record, {'action': 'clear_indicators', 'tag': tag}, conditions)
 
 def delete_subfield(record, tag, subfield_code, conditions=[]):
-    if conditions:
-        assert all([isinstance(c, Condition) for c in conditions])
+    return _apply_rule(record, {'action': 'delete_subfield', 'tag': tag, 'code': subfield_code}, conditions)
 
-        for field in record.get_fields(tag):
-            for subfields in [x.subfields for x in conditions]:
-                for code, val in subfields:
-                    if val in field.get_values(code):
-                        field.subfields = [x for x in field.subfields if code != subfield_code]
+def change_indicators():
+    pass
 
-    return record
+def _apply_rule(record, rule, conditions):
+    assert all([isinstance(c, Condition) for c in conditions])
+    rule['conditions'] = [[code, val] for c in conditions for code, val in (c.subfields.items() if isinstance(c.subfields, dict) else c.subfields)]
 
-def delete_indicators():
-    pass
+    return _rule_set(json.dumps(rule, sort_keys=True)).apply(record)
 
-def change_indicators():
-    pass
+@functools.lru_cache(maxsize=None)
+def _rule_set(rule):
+    return RuleSet([json.loads(rule)])
 
 ###
 
@@ -0,0 +1,106 @@
+"""Delete the auths listed in a file, unless records link to them"""
+
+import sys, time
+from argparse import ArgumentParser
+from dlx import DB
+from dlx.marc import AuthSet
+from batch_edits.references import ReferenceIndex
+
+USER = 'delete_auths_' + str(int(time.time()))
+
+def get_args():
+    parser = ArgumentParser(description='Delete the auths with the ids listed in a file, one per line. Auths that bibs or other auths link to are reported instead of deleted.')
+    parser.add_argument('--connect', required=True, help='DLX connection string')
+    parser.add_argument('--database', help='The database name')
+    parser.add_argument('--file', required=True, help='File of auth ids, one per line. A header line is skipped.')
+    parser.add_argument('--batch_size', type=int, default=1000, help='Number of auths to load per query')
+    parser.add_argument('--report_file', help='Write the linked auths to this TSV file of auth id, link count and linking record ids, instead of printing them')
+    parser.add_argument('--dry_run', action='store_true', help='Report what would be deleted without deleting anything')
+
+    return parser.parse_args()
+
+def run(**kwargs):
+    if kwargs:
+        sys.argv = [sys.argv[0]]
+
+        for param, arg in kwargs.items():
+            sys.argv.append(f'--{param}' if isinstance(arg, bool) else f'--{param}={arg}')
+
+    args = get_args()
+
+    if DB.database_name == 'testing':
+        # let the test module connect to the DB
+        pass
+    else:
+        DB.connect(args.connect, database=args.database)
+
+    with open(args.file, encoding='utf-8') as f:
+        candidates = read_ids(f)
+
+    existing = {doc['_id'] for doc in DB.auths.find({'_id': {'$in': candidates}}, projection={'_id': 1})}
+    not_found = [xref for xref in candidates if xref not in existing]
+    candidates = [xref for xref in candidates if xref in existing]
+
+    # one scan of each collection for all the candidates
+    bib_refs = ReferenceIndex(DB.bibs, xrefs=candidates)
+    auth_refs = ReferenceIndex(DB.auths, xrefs=candidates)
+    linked = [xref for xref in candidates if xref in bib_refs or xref in auth_refs]
+    unlinked = [xref for xref in candidates if xref not in bib_refs and xref not in auth_refs]
+    deleted = 0 if args.dry_run else delete(unlinked, args.batch_size)
+
+    for xref in not_found:
+        print(f'--> auth id {xref}: not found')
+
+    report = []
+
+    for xref in linked:
+        count = bib_refs.count(xref) + auth_refs.count(xref)
+        ids = [f'bib {_id}' for _id in bib_refs.records.get(xref, [])] + [f'auth {_id}' for _id in auth_refs.records.get(xref, [])]
+        report.append((xref, count, ', '.join(ids)))
+
+    if args.report_file:
+        with open(args.report_file, 'w', encoding='utf-8') as f:
+            f.writelines(f'{xref}\t{count}\t{ids}\n' for xref, count, ids in report)
+    else:
+        for xref, count, ids in report:
+            print(f'--> auth id {xref}: not deleted, {count} link(s) from {ids}')
+
+    if args.dry_run:
+        print(f'Auths: {len(unlinked)} would be deleted, {len(linked)} linked, {len(not_found)} not found (dry run)')
+    else:
+        print(f'Auths: {deleted} deleted, {len(linked)} linked, {len(not_found)} not found')
+
+    return unlinked, linked, not_found
+
+def read_ids(lines):
+    """The auth ids in `lines`, one per line, in order and without duplicates"""
+    ids = {}
+
+    for i, line in enumerate(lines):
+        if not (line := line.strip()):
+            continue
+
+        try:
+            ids[int(line.split('\t')[0])] = True
+        except ValueError:
+            if i == 0:
+                # header
+                continue
+
+            raise Exception(f'Line {i + 1}: invalid auth id "{line}"')
+
+    return list(ids)
+
+def delete(xrefs, batch_size=1000):
+    """Delete the auths with `Marc.delete`, which records the deletion in auth_history. Returns the number deleted"""
+    deleted = 0
+
+    for i in range(0, len(xrefs), batch_size):
+        for auth in AuthSet.from_query({'_id': {'$in': xrefs[i:i + batch_size]}}):
+            auth.delete(user=USER)
+            deleted += 1
+
+    return deleted
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,140 @@
+"""Delete the bib fields listed in a TSV file, in bulk"""
+
+import sys, time
+from argparse import ArgumentParser
+from collections import Counter
+from dlx import DB
+from dlx.marc import BibSet
+from batch_edits.bulk import BulkCommitter
+
+USER = 'delete_fields_' + str(int(time.time()))
+
+def get_args():
+    parser = ArgumentParser(description='Delete the fields with a given subfield value, from a TSV file of record id, tag, subfield code and value. A header row is skipped.')
+    parser.add_argument('--connect', required=True, help='DLX connection string')
+    parser.add_argument('--database', help='The database name')
+    parser.add_argument('--file', required=True, help='TSV file of record id, tag, subfield code, value')
+    parser.add_argument('--tag', help='Tag for rows with only a record id and value')
+    parser.add_argument('--code', help='Subfield code for rows with only a record id and value')
+    parser.add_argument('--chunk_size', type=int, default=1000, help='Number of records to fetch per query')
+    parser.add_argument('--batch_size', type=int, default=1000, help='Number of records to commit per batch')
+    parser.add_argument('--unmatched_file', help='Write the rows that matched no field to this file, instead of printing them')
+    parser.add_argument('--dry_run', action='store_true', help='Report the deletions without committing them')
+
+    return parser.parse_args()
+
+def run(**kwargs):
+    if kwargs:
+        sys.argv = [sys.argv[0]]
+
+        for param, arg in kwargs.items():
+            sys.argv.append(f'--{param}' if isinstance(arg, bool) else f'--{param}={arg}')
+
+    args = get_args()
+
+    if DB.database_name == 'testing':
+        # let the test module connect to the DB
+        pass
+    else:
+        DB.connect(args.connect, database=args.database)
+
+    with open(args.file, encoding='utf-8') as f:
+        rows = group_rows(read_rows(f, args.tag, args.code))
+
+    committer = None if args.dry_run else BulkCommitter(USER, batch_size=args.batch_size, fallback=lambda record, _: record.commit(user=USER))
+    counts, unmatched = Counter(), []
+    ids = list(rows)
+
+    for i in range(0, len(ids), args.chunk_size):
+        chunk = ids[i:i + args.chunk_size]
+        found = set()
+
+        for bib in BibSet.from_query({'_id': {'$in': chunk}}):
+            found.add(bib.id)
+            deleted, missed = delete_fields(bib, rows[bib.id])
+            unmatched += missed
+
+            if deleted:
+                print(f'--> record id {bib.id}: deleting {deleted} field(s)')
+                counts['fields deleted'] += deleted
+                counts['records updated'] += 1
+
+                if committer:
+                    committer.add(bib)
+
+        unmatched += [row for _id in chunk if _id not in found for row in rows[_id]]
+
+    if committer:
+        committer.flush()
+
+    counts['rows'] = sum(len(x) for x in rows.values())
+    counts['unmatched rows'] = len(unmatched)
+
+    if args.unmatched_file:
+        with open(args.unmatched_file, 'w', encoding='utf-8') as f:
+            f.writelines('\t'.join(map(str, row)) + '\n' for row in unmatched)
+    else:
+        for row in unmatched:
+            print('No match: ' + '\t'.join(map(str, row)))
+
+    print(', '.join(f'{name}: {counts[name]}' for name in ('rows', 'records updated', 'fields deleted', 'unmatched rows')) + (' (dry run)' if args.dry_run else ''))
+
+    return counts, unmatched
+
+def read_rows(lines, tag=None, code=None):
+    """Yield (record id, tag, code, value) from TSV lines, skipping blank lines and a header"""
+    for i, line in enumerate(lines):
+        line = line.rstrip('\r\n')
+
+        if not line.strip():
+            continue
+
+        cols = line.split('\t')
+
+        if len(cols) == 2 and tag and code:
+            cols = [cols[0], tag, code, cols[1]]
+
+        if len(cols) != 4:
+            raise Exception(f'Line {i + 1}: expected record id, tag, subfield code and value')
+
+        try:
+            _id = int(cols[0])
+        except ValueError:
+            if i == 0:
+                # header
+                continue
+
+            raise Exception(f'Line {i + 1}: invalid record id "{cols[0]}"')
+
+        yield (_id, cols[1], cols[2], cols[3])
+
+def group_rows(rows):
+    """{record id: [rows]}, in the order the records first appear"""
+    grouped = {}
+
+    for row in rows:
+        grouped.setdefault(row[0], []).append(row)
+
+    return grouped
+
+def delete_fields(record, rows):
+    """Delete the fields matched by `rows` from a record in one pass. Returns the number of fields deleted and the unmatched rows"""
+    targets = {(tag, code, value) for _, tag, code, value in rows}
+    tags = {target[0] for target in targets}
+    matched, kept = set(), []
+
+    for field in record.fields:
+        hits = {(field.tag, sub.code, sub.value) for sub in field.subfields} & targets if field.tag in tags and hasattr(field, 'subfields') else None
+
+        if hits:
+            matched |= hits
+        else:
+            kept.append(field)
+
+    deleted = len(record.fields) - len(kept)
+    record.fields = kept
+
+    return deleted, [row for row in rows if row[1:] not in matched]
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,99 @@
+"""Cheap before/after change tracking for records"""
+
+import copy
+from collections import Counter
+
+class Snapshot():
+    """The state of a record's fields before editing.
+
+    Takes a shallow copy of each field and its subfields, which is enough to
+    survive the edits as they replace field attributes, subfield lists and
+    subfield values rather than mutating them further down. Comparison uses a
+    tuple fingerprint per field, the same way `dlx.marc.Diff` compares fields.
+    "_" indicators are taken as blank, so normalizing them isn't a change.
+    """
+
+    def __init__(self, record):
+        self.fields = [_copy_field(field) for field in record.fields]
+        self.fingerprints = [fingerprint(field) for field in self.fields]
+
+    def removed(self, record):
+        """The snapshot fields that are no longer in `record`. Same as `Diff(snapshot, record).a`"""
+        current = {fingerprint(field) for field in record.fields}
+
+        return [field for field, fp in zip(self.fields, self.fingerprints) if fp not in current]
+
+    def changed(self, record):
+        """True if fields of `record` were removed, added or changed since the snapshot, in any order"""
+        return Counter(self.fingerprints) != Counter(map(fingerprint, record.fields))
+
+    def changed_tags(self, record):
+        """The tags whose fields differ between the snapshot and `record`"""
+        before, after = {}, {}
+
+        for fp in self.fingerprints:
+            before.setdefault(fp[0], []).append(fp)
+
+        for fp in map(fingerprint, record.fields):
+            after.setdefault(fp[0], []).append(fp)
+
+        return {tag for tag in set(before) | set(after) if before.get(tag) != after.get(tag)}
+
+def field_state(record):
+    """The fields of `record` and their fingerprints, to pass to `compare` after an edit.
+
+    The fields are kept so their ids can't be reused by new fields.
+    """
+    return [(field, fingerprint(field)) for field in record.fields]
+
+def compare(before, record):
+    """The changes to the fields of `record` since `before`, from `field_state`.
+
+    Fields are compared by fingerprint as a multiset, so a field deleted and
+    added again with the same content is not a change. Field ids are only used
+    to find the fields moved to another tag, which are left out of the comparison.
+    Returns [(from tag, to tag)] of the moved fields, and {tag: [removed, added]}
+    of the numbers of fields of each tag that are no longer there and that are new.
+    """
+    current = {id(field) for field in record.fields}
+    moves, moved, old = [], set(), Counter()
+
+    for field, fp in before:
+        if id(field) in current and field.tag != fp[0]:
+            moves.append((fp[0], field.tag))
+            moved.add(id(field))
+        else:
+            old[fp] += 1
+
+    new = Counter(fingerprint(field) for field in record.fields if id(field) not in moved)
+    changes = {}
+
+    for fp, n in (old - new).items():
+        changes.setdefault(fp[0], [0, 0])[0] += n
+
+    for fp, n in (new - old).items():
+        changes.setdefault(fp[0], [0, 0])[1] += n
+
+    return moves, changes
+
+def fingerprint(field):
+    if not hasattr(field, 'subfields'):
+        return (field.tag, field.value)
+
+    # linked subfields are compared by xref, as they are stored
+    subfields = tuple((sub.code, ('xref', sub.xref)) if getattr(sub, 'xref', None) else (sub.code, sub.value) for sub in field.subfields)
+
+    return (field.tag, _blank(field.ind1), _blank(field.ind2), subfields)
+
+def _blank(indicator):
+    # "_" is entered for a blank indicator in some records, and is normalized to " " by the edits
+    return ' ' if indicator == '_' else indicator
+
+def _copy_field(field):
+    field = copy.copy(field)
+
+    if hasattr(field, 'subfields'):
+        field.ind1, field.ind2 = _blank(field.ind1), _blank(field.ind2)
+        field.subfields = [copy.copy(sub) for sub in field.subfields]
+
+    return field
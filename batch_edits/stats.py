@@ -0,0 +1,62 @@
+"""Per-edit change statistics"""
+
+import time
+from collections import Counter
+from batch_edits.snapshot import field_state, compare
+
+COLUMNS = ('records touched', 'fields deleted', 'fields moved', 'fields added', 'subfields removed')
+
+class EditStats():
+    """Counts of the changes made by each edit, collected without writing anything"""
+
+    def __init__(self):
+        self.edits = {}
+        self.records = 0
+        self.start = time.perf_counter()
+
+    def before(self, record):
+        """The state of `record` to pass to `after` once the edit has run"""
+        return field_state(record)
+
+    def after(self, name, state, record):
+        """Count the changes to `record` made by edit `name` since `state`"""
+        counts = self.edits.setdefault(name, Counter())
+        moves, changes = compare(state, record)
+
+        if moves:
+            counts['fields moved'] += len(moves)
+
+        for removed, added in changes.values():
+            # the fields of a tag that are both removed and added were changed
+            if removed > added:
+                counts['fields deleted'] += removed - added
+            elif added > removed:
+                counts['fields added'] += added - removed
+
+        current = {id(field) for field in record.fields}
+
+        for field, fp in state:
+            if id(field) in current and hasattr(field, 'subfields') and (removed := len(fp[3]) - len(field.subfields)) > 0:
+                counts['subfields removed'] += removed
+
+        if moves or changes:
+            counts['records touched'] += 1
+
+    def merge(self, other):
+        self.records += other.records
+
+        for name, counts in other.edits.items():
+            self.edits.setdefault(name, Counter()).update(counts)
+
+    def report(self):
+        elapsed = time.perf_counter() - self.start
+        width = max([len(name) for name in self.edits] + [4])
+        lines = ['edit'.ljust(width) + ''.join(f'  {column:>17}' for column in COLUMNS)]
+
+        for name, counts in self.edits.items():
+            lines.append(name.ljust(width) + ''.join(f'  {counts[column]:>17}' for column in COLUMNS))
+
+        rate = self.records / elapsed if elapsed else 0
+        lines.append(f'{self.records} records in {elapsed:.1f}s ({rate:.1f} records/second)')
+
+        return '\n'.join(lines)
@@ -0,0 +1,45 @@
+from dlx import DB
+from dlx.marc import Auth
+from batch_edits.auth_cache import AuthCache
+
+DB.connect('mongomock://localhost')
+
+def test_lookup_is_cached():
+    auth = Auth().set('100', 'a', 'cached')
+    auth.commit()
+    cache = AuthCache()
+
+    assert cache.lookup(auth.id, 'a') == 'cached'
+    assert cache.lookup(auth.id, 'a') == 'cached'
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_get_and_exists():
+    auth = Auth().set('100', 'a', 'exists')
+    auth.commit()
+    cache = AuthCache()
+
+    assert cache.get(auth.id).id == auth.id
+    assert cache.exists(auth.id)
+    assert not cache.exists(999999999)
+    assert not cache.exists(999999999)
+    assert cache.hits == 2
+
+def test_lru_eviction():
+    auths = [Auth().set('100', 'a', str(i)) for i in range(3)]
+    [auth.commit() for auth in auths]
+    cache = AuthCache(maxsize=2)
+    [cache.get(auth.id) for auth in auths]
+
+    assert list(cache.records.keys()) == [auths[1].id, auths[2].id]
+
+def test_prefetch():
+    auths = [Auth().set('110', 'a', f'prefetch {i}').set('110', 'g', 'g') for i in range(3)]
+    [auth.commit() for auth in auths]
+    cache = AuthCache()
+
+    assert cache.prefetch([auth.id for auth in auths] + [999999999]) == 3
+    assert cache.lookup(auths[0].id, 'a') == 'prefetch 0'
+    assert cache.lookup(auths[0].id, 'g') == 'g'
+    assert cache.lookup(auths[0].id, 'z') is None
+    assert not cache.exists(999999999)
+    assert cache.prefetch([auth.id for auth in auths]) == 0
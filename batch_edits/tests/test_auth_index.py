@@ -0,0 +1,34 @@
+from dlx import DB
+from dlx.marc import Auth
+from batch_edits.auth_cache import AuthCache
+from batch_edits.auth_index import AuthIndex
+
+DB.connect('mongomock://localhost')
+
+def test_index():
+    auths = [Auth().set('100', 'a', f'indexed {i}') for i in range(3)]
+    [auth.commit() for auth in auths]
+    index = AuthIndex()
+
+    assert all(auth.id in index for auth in auths)
+    assert len(index) == DB.auths.count_documents({})
+    assert 999999999 not in index and -1 not in index and 'x' not in index
+
+def test_refresh():
+    index = AuthIndex(refresh=60)
+    auth = Auth().set('100', 'a', 'new')
+    auth.commit()
+    assert auth.id not in index
+
+    index.loaded -= 61
+    assert auth.id in index
+
+def test_cache_with_index():
+    auth = Auth().set('100', 'a', 'indexed')
+    auth.commit()
+    cache = AuthCache(index=AuthIndex())
+
+    assert cache.exists(auth.id)
+    assert cache.misses == 0
+    assert not cache.exists(999999999)
+    assert 'auth ids indexed' in cache.stats()
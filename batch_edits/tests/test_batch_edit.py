@@ -1,4 +1,4 @@
-import sys, pytest, random
+import sys, copy, json, functools, pytest, random
 from datetime import datetime
 from pytz import timezone
 from dlx import DB
@@ -25,6 +25,138 @@ def test_script_runs(bibs):
     batch_edit.run(connect='mongomock://localhost', output='db', skip_confirm=True)
     assert all([bib.user[:10] == 'batch_edit' for bib in BibSet.from_query({})])
     
+def test_999_only_on_changed_records(bibs):
+    [bib.set('710', '9', 'dummy') and bib.commit() for bib in list(BibSet.from_query({}))[:5]]
+    batch_edit.run(connect='mongomock://localhost', output='db', skip_confirm=True, initials='xyz')
+    stamped = [bib for bib in BibSet.from_query({}) if bib.get_field('999')]
+    assert len(stamped) == 5
+    assert all([bib.user[:10] == 'batch_edit' and bib.get_value('999', 'a')[:3] == 'xyb' for bib in stamped])
+
+def test_script_runs_bulk(bibs):
+    [bib.set('710', '9', 'dummy') and bib.commit() for bib in BibSet.from_query({})]
+    batch_edit.run(connect='mongomock://localhost', output='db', skip_confirm=True, batch_size=7)
+    assert all([bib.user[:10] == 'batch_edit' for bib in BibSet.from_query({})])
+    assert not any([bib.get_value('710', '9') for bib in BibSet.from_query({})])
+
+def test_script_runs_writers(bibs):
+    [bib.set('710', '9', 'dummy') and bib.commit() for bib in BibSet.from_query({})]
+    batch_edit.run(connect='mongomock://localhost', output='db', skip_confirm=True, writers=3, queue_size=2)
+    assert all([bib.user[:10] == 'batch_edit' for bib in BibSet.from_query({})])
+    assert not any([bib.get_value('710', '9') for bib in BibSet.from_query({})])
+
+def test_script_runs_read_ahead(bibs):
+    [bib.set('710', '9', 'dummy') and bib.commit() for bib in BibSet.from_query({})]
+    batch_edit.run(connect='mongomock://localhost', output='db', skip_confirm=True, page_size=4, read_ahead=2, read_batch_size=10)
+    assert all([bib.user[:10] == 'batch_edit' for bib in BibSet.from_query({})])
+
+def test_script_runs_auth_index(bibs, capsys):
+    [bib.set('710', '9', 'dummy') and bib.commit() for bib in BibSet.from_query({})]
+    batch_edit.run(connect='mongomock://localhost', output='db', skip_confirm=True, auth_index=True)
+    assert all([bib.user[:10] == 'batch_edit' for bib in BibSet.from_query({})])
+    assert 'auth ids loaded' in capsys.readouterr().out
+
+def test_script_runs_memory_budget(bibs, capsys):
+    [bib.set('710', '9', 'dummy') and bib.commit() for bib in BibSet.from_query({})]
+    batch_edit.run(connect='mongomock://localhost', output='db', skip_confirm=True, page_size=4, read_ahead=2, memory_budget=1, memory_interval=5)
+    assert all([bib.user[:10] == 'batch_edit' for bib in BibSet.from_query({})])
+    assert 'over the budget' in capsys.readouterr().out
+
+def test_check_xrefs(bibs, capsys):
+    DB.bibs.update_one({'_id': 1}, {'$set': {'700': [{'indicators': [' ', ' '], 'subfields': [{'code': 'a', 'xref': 424242}]}]}})
+    assert batch_edit._check_xrefs({}) == [424242]
+    assert 'auth id 424242: not found, linked from bib(s) 1' in capsys.readouterr().out
+
+def test_plan_and_apply(bibs, tmp_path):
+    [bib.set('710', '9', 'dummy') and bib.commit(user='testing') for bib in BibSet.from_query({})]
+    plan_file = str(tmp_path / 'plan.jsonl')
+    batch_edit.run(command='plan', connect='mongomock://localhost', plan_file=plan_file)
+    assert all([bib.user == 'testing' for bib in BibSet.from_query({})])
+    assert len(open(plan_file).readlines()) == 30
+
+    changed = next(iter(BibSet.from_query({})))
+    changed.set('500', 'a', 'changed after plan').commit(user='testing')
+
+    applier = batch_edit.run(command='apply', connect='mongomock://localhost', plan_file=plan_file, batch_size=7)
+    assert applier.applied == 29 and applier.conflicts == [changed.id]
+    assert not any([bib.get_value('710', '9') for bib in BibSet.from_query({'_id': {'$ne': changed.id}})])
+    assert all([bib.get_field('999') for bib in BibSet.from_query({'_id': {'$ne': changed.id}})])
+
+def test_review(bibs, monkeypatch):
+    records = list(BibSet.from_query({}))
+    [bib.set('710', '9', 'dummy') and bib.commit() for bib in records[:10]]
+    [bib.set('222', 'a', 'dummy') and bib.commit() for bib in records[10:15]]
+    answers = iter(['y', 'n'])
+    monkeypatch.setattr('builtins.input', lambda _: next(answers))
+
+    batch_edit.run(connect='mongomock://localhost', output='db', review=True, batch_size=4, compression='gzip')
+    updated = [bib.id for bib in BibSet.from_query({}) if bib.user[:10] == 'batch_edit']
+    assert sorted(updated) == sorted([bib.id for bib in records[:10]])
+    assert all([bib.get_field('222') for bib in BibSet.from_query({'_id': {'$in': [bib.id for bib in records[10:15]]}})])
+
+def test_checkpoint_resume(bibs, tmp_path):
+    checkpoint, out = tmp_path / 'checkpoint.json', tmp_path / 'out.mrk'
+    [bib.set('710', '9', 'dummy') and bib.commit() for bib in BibSet.from_query({})]
+    ids = sorted([bib.id for bib in BibSet.from_query({})])
+
+    batch_edit.run(connect='mongomock://localhost', output='mrk', output_file=str(out), checkpoint=str(checkpoint), limit=10)
+    assert json.loads(checkpoint.read_text())['last_id'] == ids[9]
+
+    batch_edit.run(connect='mongomock://localhost', output='mrk', output_file=str(out), checkpoint=str(checkpoint), resume=True)
+    assert json.loads(checkpoint.read_text())['last_id'] == ids[-1]
+    assert out.read_text().count('=999  ') == len(ids)
+
+def test_checkpoint_bulk(bibs, tmp_path):
+    checkpoint = tmp_path / 'checkpoint.json'
+    [bib.set('710', '9', 'dummy') and bib.commit() for bib in BibSet.from_query({})]
+    batch_edit.run(connect='mongomock://localhost', output='db', skip_confirm=True, batch_size=7, checkpoint=str(checkpoint))
+    assert json.loads(checkpoint.read_text())['last_id'] == max(bib.id for bib in BibSet.from_query({}))
+    assert not any([bib.get_value('710', '9') for bib in BibSet.from_query({})])
+
+def test_resume_after_crash(bibs, tmp_path, monkeypatch):
+    checkpoint, out = tmp_path / 'checkpoint.json', tmp_path / 'out.mrk'
+    [bib.set('710', '9', 'dummy') and bib.commit() for bib in BibSet.from_query({})]
+    ids = sorted([bib.id for bib in BibSet.from_query({})])
+    edit_54 = batch_edit.edit_54
+
+    def crash(bib):
+        if bib.id == ids[7]:
+            raise KeyboardInterrupt
+
+        return edit_54(bib)
+
+    monkeypatch.setattr(batch_edit, 'edit_54', functools.wraps(edit_54)(crash))
+
+    with pytest.raises(KeyboardInterrupt):
+        batch_edit.run(connect='mongomock://localhost', output='mrk', output_file=str(out), checkpoint=str(checkpoint), checkpoint_interval=5, edits='edit_54')
+
+    assert json.loads(checkpoint.read_text())['last_id'] == ids[4]
+    monkeypatch.undo()
+    batch_edit.run(connect='mongomock://localhost', output='mrk', output_file=str(out), checkpoint=str(checkpoint), resume=True, edits='edit_54')
+    records = [line for line in out.read_text().splitlines() if line.startswith('=001')]
+    assert sorted(records) == sorted(set(records)) and len(records) == len(ids)
+
+def test_partial_commit(bibs):
+    bib = Bib().set('500', 'a', 'keep').set('040', 'a', 'keep').set('040', 'b', 'dummy')
+    bib.commit()
+    batch_edit.run(connect='mongomock://localhost', output='db', skip_confirm=True, partial=True, edits='edit_43', query=json.dumps({'_id': bib.id}))
+    bib = Bib.from_id(bib.id)
+    assert bib.get_value('500', 'a') == 'keep'
+    assert bib.get_value('040', 'a') == 'keep'
+    assert not bib.get_value('040', 'b')
+    assert bib.user[:10] == 'batch_edit'
+
+def test_dry_run(bibs, capsys):
+    [bib.set('710', '9', 'dummy') and bib.commit(user='testing') for bib in BibSet.from_query({})]
+    count = BibSet.from_query({}).count
+    batch_edit.run(connect='mongomock://localhost', dry_run=True)
+    assert all([bib.user == 'testing' for bib in BibSet.from_query({})])
+    assert all([bib.get_value('710', '9') for bib in BibSet.from_query({})])
+
+    out = capsys.readouterr().out
+    edit_54 = next(line for line in out.split('\n') if line.startswith('edit_54 '))
+    assert edit_54.split()[1] == str(count)
+    assert f'{count} records in' in out
+
 def test_edit_1():
     # 1. BIBLIOGRAPHIC - Delete field 099 if subfield c = internet
     [bib.set('099', 'c', 'internet') for bib in all_records()]
@@ -446,7 +578,7 @@ def test_reimport_991_from_linked_auth_191_uses_xref_as_value(monkeypatch):
             return auth
         return None
 
-    monkeypatch.setattr(batch_edit.Auth, 'from_query', fake_from_query)
+    monkeypatch.setattr(Auth, 'from_query', fake_from_query)
 
     batch_edit._reimport_991_from_linked_auth_191(bib)
 
@@ -464,21 +596,138 @@ def test_add_999():
     assert all([f'jsb{date}' in bib.get_values('999', 'a') for bib in all_records()])
     assert all([date in bib.get_values('999', 'b') for bib in all_records()])
     assert all([f'b' in bib.get_values('999', 'c') for bib in all_records()])
+
+    bib = batch_edit.add_999(Bib(), initials='ab', date='20240101')
+    assert bib.get_value('999', 'a') == 'abb20240101' and bib.get_value('999', 'b') == '20240101'
     
+def test_prefilter_query():
+    query = batch_edit.prefilter_query(batch_edit._get_edits('registry'))
+    unchanged = Bib().set('245', 'a', 'prefilter test').set('989', 'a', 'Speeches')
+    changed = [
+        Bib().set('245', 'a', 'prefilter test').set('040', 'b', 'dummy'),
+        Bib().set('245', 'a', 'prefilter test', ind1='1'),
+        Bib().set('245', 'a', 'prefilter test').set('930', 'a', 'dummy'),
+    ]
+    [bib.commit() for bib in [unchanged] + changed]
+    ids = [doc['_id'] for doc in DB.bibs.find({'$and': [{'245.subfields.value': 'prefilter test'}, query]})]
+    assert sorted(ids) == sorted([bib.id for bib in changed])
+
+def test_projection():
+    assert list(batch_edit.projection([batch_edit.edit_43])) == ['040', '989', '991', '999', 'updated', 'user']
+    assert '269' in batch_edit.projection([batch_edit.edit_55])
+
+def test_read_ahead():
+    assert list(batch_edit._read_ahead(iter(range(100)), 3)) == list(range(100))
+    assert [len(page) for page in batch_edit._pages(range(10), 4)] == [4, 4, 2]
+
+    def failing():
+        yield 1
+        raise ValueError('read failed')
+
+    with pytest.raises(ValueError):
+        list(batch_edit._read_ahead(failing(), 3))
+
+def test_id_ranges():
+    bibs = [Bib().set('245', 'a', 'shard test') for _ in range(5)]
+    [bib.commit() for bib in bibs]
+    query = {'245.subfields.value': 'shard test'}
+    ranges = batch_edit._id_ranges(query, 2)
+    assert len(ranges) == 2
+    assert ranges[0][0] == bibs[0].id and ranges[-1][1] == bibs[-1].id + 1
+    shards = [[doc['_id'] for doc in DB.bibs.find(batch_edit._shard_query(query, r))] for r in ranges]
+    assert sorted(sum(shards, [])) == [bib.id for bib in bibs]
+
+### equivalent ways of running the edits
+
+def test_dispatch_registry_matches_members():
+    members, registry = batch_edit._get_edits('members'), batch_edit._get_edits('registry')
+    assert [f.__name__ for f in members] == [f.__name__ for f in registry]
+
+    def setup(bib):
+        bib.set('099', 'c', 'internet').set('029', 'a', 'XX').set('035', 'a', 'dummy').set('269', 'a', '2013')
+        bib.set('930', 'a', 'other').set('040', 'b', 'dummy').set('245', 'a', 'title', ind1='1', ind2='0')
+        bib.set('250', 'a', 'dummy=').set('250', 'b', 'dummy')
+
+    _assert_same_changes(setup, lambda bib: batch_edit._edit_record(bib, members, 'members'), lambda bib: batch_edit._edit_record(bib, registry, 'registry'))
+
+def test_normalize_matches_edits():
+    edits = batch_edit._get_edits()
+
+    def setup(bib):
+        bib.set('245', 'a', 'title', ind1='1', ind2='_').set('246', 'a', 'title', ind1='_', ind2='3')
+        bib.set('040', 'a', 'NNUN').set('040', 'b', 'eng').set('079', 'q', 'dummy').set('079', 'a', 'dummy')
+        bib.set('250', 'a', 'dummy=').set('250', 'b', 'dummy').set('520', 'a', 'dummy').set('520', 'b', 'dummy').set('520', '9', 'dummy')
+        bib.set('099', 'a', 'dummy').set('099', 'q', 'dummy').set('650', '2', 'dummy').set('710', 'e', 'dummy', ind1='2').set('710', '9', 'dummy')
+        bib.set('100', 'e', 'dummy', ind1='1', ind2='2').set('440', 'a', 'dummy', ind1='_', ind2='0').set('500', 'a', 'dummy', ind1='_')
+
+    def edit(bib):
+        # as _process_record does without --normalize
+        for field in bib.datafields:
+            field.ind1 = ' ' if field.ind1 == '_' else field.ind1
+            field.ind2 = ' ' if field.ind2 == '_' else field.ind2
+
+        batch_edit._edit_record(bib, edits)
+
+    _assert_same_changes(setup, edit, lambda bib: batch_edit._edit_record(bib, edits, normalize=True))
+
+    table = batch_edit.normalize_table(tuple(edit.__name__ for edit in edits), frozenset(['speeches']))
+    assert table['245'] == (True, frozenset(), None)
+    assert table['710'] == (True, frozenset('9'), None)
+    assert '100' not in table and '079' not in table
+
+def test_rules_match_edits(tmp_path):
+    rules = [{'action': 'delete_field', 'tag': '222', 'types': ['bibliographic']}]
+    rules += [{'action': 'clear_indicators', 'tag': tag} for tag in batch_edit.INDICATOR_TAGS]
+    rules += [{'action': 'delete_subfield', 'tag': '040', 'code': 'b'}, {'action': 'delete_subfield', 'tag': '710', 'code': '9', 'types': ['bibliographic', 'speeches']}]
+    path = tmp_path / 'rules.json'
+    path.write_text(json.dumps(rules))
+    edits = batch_edit._get_edits(names='edit_12,edit_23_34_36_42,edit_43,edit_54')
+
+    def setup(bib):
+        bib.set('222', 'a', 'dummy').set('040', 'a', 'NNUN').set('040', 'b', 'eng').set('245', 'a', 'title', ind1='1', ind2='0').set('710', '9', 'dummy')
+
+    _assert_same_changes(setup, lambda bib: batch_edit._edit_record(bib, edits), lambda bib: batch_edit._edit_record(bib, batch_edit._get_edits(rules=str(path))))
+
+    edit = batch_edit.rules_edit(str(path))
+    assert edit.tags == {'222', '040', '710'} | set(batch_edit.INDICATOR_TAGS)
+    assert batch_edit.projection([edit])
+
+def _assert_same_changes(setup, edit_a, edit_b):
+    # runs both on copies of a record of each type, which must end up the same and changed
+    records = [Bib(), Bib().set('989', 'a', 'Speeches'), Bib().set('989', 'a', 'Voting Data')]
+    [setup(bib) for bib in records]
+    a, b = copy.deepcopy(records), copy.deepcopy(records)
+    [edit_a(bib) for bib in a]
+    [edit_b(bib) for bib in b]
+    assert [bib.to_mrk() for bib in a] == [bib.to_mrk() for bib in b]
+    assert [bib.to_mrk() for bib in a] != [bib.to_mrk() for bib in records]
+
 ### abstracted functions
 
-@pytest.mark.skip(reason='Not implemented yet')
 def test_delete_field():
-    pass
+    bib = Bib().set('597', 'a', 'Retrospective indexing').set('597', 'a', 'keep', address=['+']).set('222', 'a', 'dummy').set('222', 'a', 'dummy', address=['+'])
+    batch_edit.delete_field(bib, '597', [Condition('597', {'a': 'Retrospective indexing'})])
+    assert bib.get_values('597', 'a') == ['keep']
+    batch_edit.delete_field(bib, '222')
+    assert not bib.get_fields('222')
 
-@pytest.mark.skip(reason='Not implemented yet')
 def test_change_tag():
-    pass
+    bib = Bib().set('773', 'a', 'dummy').set('773', 'a', 'other', address=['+'])
+    batch_edit.change_tag(bib, '773', '580', [Condition('773', {'a': 'dummy'})])
+    assert bib.get_values('773', 'a') == ['other'] and bib.get_values('580', 'a') == ['dummy']
+    batch_edit.change_tag(bib, '773', '580')
+    assert not bib.get_fields('773') and len(bib.get_fields('580')) == 2
 
-@pytest.mark.skip(reason='Not implemented yet')
 def test_delete_indicators():
-    pass
+    bib = Bib().set('245', 'a', 'title', ind1='1', ind2='0')
+    batch_edit.delete_indicators(bib, '245', [Condition('245', {'a': 'other'})])
+    assert bib.get_field('245').ind1 == '1'
+    batch_edit.delete_indicators(bib, '245')
+    assert (bib.get_field('245').ind1, bib.get_field('245').ind2) == (' ', ' ')
 
-@pytest.mark.skip(reason='Not implemented yet')
 def test_delete_subfield():
-    pass
\ No newline at end of file
+    bib = Bib().set('520', 'a', 'dummy').set('520', 'b', 'dummy').set('520', '9', 'dummy')
+    batch_edit.delete_subfield(bib, '520', 'b', [Condition('520', {'9': 'dummy'})])
+    assert not bib.get_value('520', 'b') and bib.get_value('520', '9')
+    batch_edit.delete_subfield(bib, '520', '9')
+    assert not bib.get_value('520', '9') and bib.get_value('520', 'a')
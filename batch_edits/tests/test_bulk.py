@@ -0,0 +1,51 @@
+from datetime import datetime
+from dlx import DB
+from dlx.marc import Bib
+from batch_edits.bulk import BulkCommitter
+
+def test_same_as_commit():
+    DB.connect('mongomock://localhost')
+    single, bulk = [Bib().set('245', 'a', 'title').set('040', 'b', 'dummy') for _ in range(2)]
+    [bib.commit(user='testing') for bib in (single, bulk)]
+
+    for bib in (single, bulk):
+        bib.get_field('040').subfields = []
+        bib.set('500', 'a', 'note')
+
+    single.commit(user='tester')
+    committer = BulkCommitter('tester', batch_size=10)
+    assert not committer.add(bulk)
+    committer.flush()
+    assert committer.committed == 1 and bulk.user == 'tester'
+
+    # the same documents, apart from the ids and times
+    for collection in (DB.bibs, DB.handle['bib_history']):
+        assert _strip(collection.find_one({'_id': bulk.id})) == _strip(collection.find_one({'_id': single.id}))
+
+def test_fallback():
+    DB.connect('mongomock://localhost')
+    bibs = [Bib().set('245', 'a', f'title {i}') for i in range(4)]
+    fallbacks = []
+
+    def fallback(record, last_edit):
+        fallbacks.append((record, last_edit))
+
+        # the fallback fails to commit the last one
+        return record is bibs[1]
+
+    committer = BulkCommitter('tester', batch_size=2, fallback=fallback, check=lambda record: record not in bibs[1::2])
+    [committer.add(bib, 'edit_x') for bib in bibs]
+    committer.flush()
+
+    assert fallbacks == [(bibs[1], 'edit_x'), (bibs[3], 'edit_x')]
+    assert committer.fallbacks == 1 and committer.committed == 3
+    assert DB.bibs.count_documents({}) == 2
+
+def _strip(doc):
+    if isinstance(doc, dict):
+        return {key: _strip(value) for key, value in doc.items() if key != '_id'}
+
+    if isinstance(doc, list):
+        return [_strip(x) for x in doc]
+
+    return None if isinstance(doc, datetime) else doc
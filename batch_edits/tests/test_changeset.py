@@ -0,0 +1,90 @@
+import gzip, json, time
+from dlx import DB
+from dlx.marc import Bib, Auth
+from batch_edits.snapshot import Snapshot
+from batch_edits import changeset
+
+DB.connect('mongomock://localhost')
+
+def test_patch():
+    bib = Bib().set('245', 'a', 'title').set('040', 'a', 'NNUN').set('222', 'a', 'dummy')
+    bib.commit()
+    bib = Bib.from_id(bib.id)
+    snapshot = Snapshot(bib)
+    bib.delete_fields('222')
+    bib.set('245', 'a', 'changed')
+    patch = changeset.patch(bib, snapshot, 'edit_x')
+
+    assert patch['_id'] == bib.id and patch['edit'] == 'edit_x'
+    assert patch['updated'] == bib.updated.isoformat()
+    assert list(patch['set']) == ['245'] and patch['unset'] == ['222']
+    assert json.loads(json.dumps(patch)) == patch
+
+def test_read(tmp_path):
+    lines = [{'_id': i, 'updated': None, 'set': {}, 'unset': []} for i in range(3)]
+    path = str(tmp_path / 'plan.jsonl.gz')
+
+    with gzip.open(path, 'wt') as f:
+        f.write('\n'.join(json.dumps(x) for x in lines) + '\n\n')
+
+    assert list(changeset.read(path)) == lines
+
+    # compressed without the extension
+    path = str(tmp_path / 'plan.jsonl')
+
+    with gzip.open(path, 'wt') as f:
+        f.write(json.dumps(lines[0]) + '\n')
+
+    assert list(changeset.read(path)) == lines[:1]
+
+def test_apply():
+    bibs = [Bib().set('245', 'a', f'title {i}').set('222', 'a', 'dummy') for i in range(3)]
+    [bib.commit() for bib in bibs]
+    patches = []
+
+    for bib in bibs:
+        bib = Bib.from_id(bib.id)
+        snapshot = Snapshot(bib)
+        bib.delete_fields('222')
+        patches.append(changeset.patch(bib, snapshot))
+
+    # changed after the plan
+    bibs[1].set('500', 'a', 'note').commit()
+
+    applier = changeset.ChangeSetApplier('tester', batch_size=2, check=lambda patch: patch['_id'] != bibs[2].id)
+    [applier.add(patch) for patch in patches]
+    applier.flush()
+
+    assert applier.applied == 1 and applier.conflicts == [bibs[1].id] and applier.invalid == [bibs[2].id]
+    assert not Bib.from_id(bibs[0].id).get_field('222') and Bib.from_id(bibs[0].id).user == 'tester'
+    assert Bib.from_id(bibs[1].id).get_field('222') and Bib.from_id(bibs[2].id).get_field('222')
+    assert Bib.from_id(bibs[0].id).get_value('245', 'a') == 'title 0'
+
+def test_changed_while_applying():
+    bib = Bib().set('245', 'a', 'title').set('222', 'a', 'dummy')
+    bib.commit()
+    bib = Bib.from_id(bib.id)
+    snapshot = Snapshot(bib)
+    bib.delete_fields('222')
+    patch = changeset.patch(bib, snapshot)
+
+    def check(patch):
+        # another edit committed after the batch was loaded, in a later millisecond than the plan's version
+        time.sleep(0.002)
+        Bib.from_id(patch['_id']).set('500', 'a', 'note').commit()
+
+        return True
+
+    applier = changeset.ChangeSetApplier('tester', check=check)
+    applier.add(patch)
+    applier.flush()
+
+    assert applier.applied == 0 and applier.conflicts == [bib.id]
+    assert Bib.from_id(bib.id).get_value('500', 'a') == 'note' and Bib.from_id(bib.id).get_field('222')
+
+def test_xrefs():
+    auth = Auth().set('100', 'a', 'linked')
+    auth.commit()
+    bib = Bib().set('700', 'a', auth.id)
+    snapshot = Snapshot(Bib())
+    assert changeset.xrefs(changeset.patch(bib, snapshot)) == {auth.id}
@@ -0,0 +1,21 @@
+from batch_edits.checkpoint import Checkpoint
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    checkpoint = Checkpoint(path)
+    checkpoint.last_id = 10
+    checkpoint.failed = {3, 7}
+    checkpoint.save()
+
+    loaded = Checkpoint.load(path)
+    assert loaded.last_id == 10
+    assert loaded.failed == {3, 7}
+
+def test_query():
+    checkpoint = Checkpoint('unused')
+    assert checkpoint.query({'a': 1}) == {'a': 1}
+
+    checkpoint.last_id = 10
+    checkpoint.failed = {3}
+    assert checkpoint.query({}) == {'$or': [{'_id': {'$gt': 10}}, {'_id': {'$in': [3]}}]}
+    assert checkpoint.query({'a': 1}) == {'$and': [{'a': 1}, {'$or': [{'_id': {'$gt': 10}}, {'_id': {'$in': [3]}}]}]}
@@ -0,0 +1,27 @@
+import io
+from dlx import DB
+from dlx.marc import Bib, Auth
+from batch_edits.scripts import delete_auths
+
+def test_read_ids():
+    assert delete_auths.read_ids(io.StringIO('id\n1\n\n2\n1\n')) == [1, 2]
+
+def test_run(tmp_path):
+    DB.connect('mongomock://localhost')
+    auths = [Auth().set('100', 'a', f'candidate {i}') for i in range(4)]
+    [auth.commit() for auth in auths]
+    bib = Bib().set('700', 'a', auths[0].id)
+    bib.commit()
+    see_also = Auth().set('100', 'a', 'see also').set('500', 'a', auths[1].id)
+    see_also.commit()
+    path, report = tmp_path / 'ids.txt', tmp_path / 'linked.tsv'
+    path.write_text('auth id\n' + '\n'.join(str(auth.id) for auth in auths) + '\n999999999\n')
+
+    unlinked, linked, not_found = delete_auths.run(connect='mongomock://localhost', file=str(path), dry_run=True)
+    assert unlinked == [auths[2].id, auths[3].id] and linked == [auths[0].id, auths[1].id] and not_found == [999999999]
+    assert DB.auths.count_documents({'_id': auths[2].id}) == 1
+
+    delete_auths.run(connect='mongomock://localhost', file=str(path), batch_size=1, report_file=str(report))
+    assert DB.auths.count_documents({'_id': {'$in': [auth.id for auth in auths]}}) == 2
+    assert DB.handle['auth_history'].find_one({'_id': auths[2].id})['deleted']['user'] == delete_auths.USER
+    assert report.read_text().splitlines() == [f'{auths[0].id}\t1\tbib {bib.id}', f'{auths[1].id}\t1\tauth {see_also.id}']
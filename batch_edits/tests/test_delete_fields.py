@@ -0,0 +1,38 @@
+import io, pytest
+from dlx import DB
+from dlx.marc import Bib
+from batch_edits.scripts import delete_fields
+
+def test_read_rows():
+    lines = io.StringIO('id\ttag\tcode\tvalue\n1\t856\tu\thttp://a\n\n2\t856\tu\thttp://b\n')
+    assert list(delete_fields.read_rows(lines)) == [(1, '856', 'u', 'http://a'), (2, '856', 'u', 'http://b')]
+
+    lines = io.StringIO('035__a-2\tLink\n1\thttp://a\n')
+    assert list(delete_fields.read_rows(lines, tag='856', code='u')) == [(1, '856', 'u', 'http://a')]
+
+    with pytest.raises(Exception):
+        list(delete_fields.read_rows(io.StringIO('1\t856\tu\thttp://a\nx\t856\tu\thttp://b\n')))
+
+def test_delete_fields():
+    bib = Bib().set('245', 'a', 'title').set('856', 'u', 'http://a').set('856', 'u', 'http://b', address=['+']).set('856', 'u', 'http://c', address=['+'])
+    deleted, unmatched = delete_fields.delete_fields(bib, [(1, '856', 'u', 'http://a'), (1, '856', 'u', 'http://c'), (1, '856', 'u', 'http://x')])
+    assert deleted == 2 and unmatched == [(1, '856', 'u', 'http://x')]
+    assert bib.get_values('856', 'u') == ['http://b'] and bib.get_value('245', 'a') == 'title'
+
+def test_run(tmp_path):
+    DB.connect('mongomock://localhost')
+    bibs = [Bib().set('856', 'u', f'http://{i}').set('856', 'u', f'http://{i}/other', address=['+']) for i in range(3)]
+    [bib.commit(user='testing') for bib in bibs]
+    path, unmatched_path = tmp_path / 'data.tsv', tmp_path / 'unmatched.tsv'
+    rows = [f'{bibs[0].id}\thttp://0', f'{bibs[0].id}\thttp://0/other', f'{bibs[1].id}\thttp://1', f'{bibs[1].id}\thttp://none', '999999999\thttp://x']
+    path.write_text('id\tlink\n' + '\n'.join(rows) + '\n')
+
+    counts, unmatched = delete_fields.run(connect='mongomock://localhost', file=str(path), tag='856', code='u', dry_run=True)
+    assert counts['records updated'] == 2 and Bib.from_id(bibs[0].id).get_values('856', 'u') == ['http://0', 'http://0/other']
+
+    counts, unmatched = delete_fields.run(connect='mongomock://localhost', file=str(path), tag='856', code='u', chunk_size=1, batch_size=1, unmatched_file=str(unmatched_path))
+    assert (counts['rows'], counts['records updated'], counts['fields deleted'], counts['unmatched rows']) == (5, 2, 3, 2)
+    assert not Bib.from_id(bibs[0].id).get_fields('856')
+    assert Bib.from_id(bibs[1].id).get_values('856', 'u') == ['http://1/other']
+    assert Bib.from_id(bibs[1].id).user == delete_fields.USER and Bib.from_id(bibs[2].id).user == 'testing'
+    assert unmatched_path.read_text().splitlines() == [f'{bibs[1].id}\t856\tu\thttp://none', '999999999\t856\tu\thttp://x']
@@ -0,0 +1,29 @@
+from batch_edits.memory import MemoryMonitor, MB
+
+def test_check_and_release(capsys):
+    released = []
+    monitor = MemoryMonitor(budget=1, interval=3, release=[lambda: released.append(True)])
+
+    assert not monitor.check() and not monitor.check()
+    assert monitor.check() and monitor.over
+    assert released == [True]
+    assert 'over the budget' in capsys.readouterr().out
+
+    monitor.budget = 10 ** 6 * MB
+    [monitor.check() for _ in range(3)]
+    assert not monitor.over
+    assert 'back under budget' in capsys.readouterr().out
+
+def test_throttle():
+    monitor = MemoryMonitor(budget=1, interval=1)
+    monitor.throttle(lambda: True)
+
+    monitor.check()
+    pending = iter([True, True, False])
+    monitor.throttle(lambda: next(pending))
+
+def test_report():
+    monitor = MemoryMonitor(trace=True)
+    assert monitor.rss() > 0
+    assert 'Python heap' in monitor.report() and 'budget' not in monitor.report()
+    monitor.stop()
@@ -0,0 +1,51 @@
+import gzip, pytest
+from batch_edits.mrk import MrkWriter
+
+def test_write_plain(tmp_path):
+    path = str(tmp_path / 'out.mrk')
+
+    with MrkWriter(path) as out:
+        out.write('=245  \\\\$atitle\n')
+        assert not (tmp_path / 'out.mrk').exists()
+
+    assert (tmp_path / 'out.mrk').read_text() == '=245  \\\\$atitle\n'
+    assert not (tmp_path / 'out.mrk.part').exists()
+
+def test_write_gzip_and_append(tmp_path):
+    path = str(tmp_path / 'out.mrk.gz')
+
+    with MrkWriter(path) as out:
+        out.write('first\n')
+
+    with MrkWriter(path, append=True) as out:
+        out.write('second\n')
+
+    with gzip.open(path, 'rt') as f:
+        assert f.read() == 'first\nsecond\n'
+
+def test_incomplete_not_renamed(tmp_path):
+    path = str(tmp_path / 'out.mrk')
+
+    with pytest.raises(ValueError):
+        with MrkWriter(path) as out:
+            out.write('partial\n')
+            raise ValueError
+
+    assert not (tmp_path / 'out.mrk').exists()
+    assert (tmp_path / 'out.mrk.part').read_text() == 'partial\n'
+
+def test_truncate_on_append(tmp_path):
+    path = str(tmp_path / 'out.mrk')
+
+    with MrkWriter(path) as out:
+        out.write('first\n')
+        size = out.tell()
+        out.write('after the checkpoint\n')
+
+    with MrkWriter(path, append=True, truncate=size) as out:
+        out.write('second\n')
+
+    assert (tmp_path / 'out.mrk').read_text() == 'first\nsecond\n'
+
+    with pytest.raises(Exception):
+        MrkWriter(path + '.gz', append=True, truncate=0)
@@ -0,0 +1,27 @@
+import time, threading
+from batch_edits.pipeline import CommitPipeline
+
+class Record():
+    def __init__(self, id):
+        self.id = id
+
+def test_commits_and_ordered_errors():
+    committed = []
+    lock = threading.Lock()
+
+    def commit(record, suffix):
+        time.sleep(0.001 * (record.id % 3))
+
+        if record.id % 5 == 0:
+            raise Exception(f'failed {record.id}{suffix}')
+
+        with lock:
+            committed.append(record.id)
+
+    pipeline = CommitPipeline(commit, writers=3, queue_size=2)
+    [pipeline.submit(Record(i), '!') for i in range(1, 21)]
+    errors = pipeline.close()
+
+    assert sorted(committed) == [i for i in range(1, 21) if i % 5]
+    assert pipeline.committed == 16
+    assert errors == [(i, f'failed {i}!') for i in (5, 10, 15, 20)]
@@ -0,0 +1,23 @@
+from dlx import DB
+from dlx.marc import Bib, Auth
+from batch_edits.references import ReferenceIndex
+
+def test_index():
+    DB.connect('mongomock://localhost')
+    auths = [Auth().set('100', 'a', f'linked {i}') for i in range(3)]
+    [auth.commit() for auth in auths]
+    bibs = [Bib().set('700', 'a', auths[0].id).set('710', 'a', auths[1].id) for _ in range(2)]
+    [bib.commit() for bib in bibs]
+    DB.bibs.insert_one({'_id': 999001, '000': ['leader'], '700': [{'indicators': [' ', ' '], 'subfields': [{'code': 'a', 'xref': 424242}]}]})
+
+    index = ReferenceIndex()
+    assert index.count(auths[0].id) == 2 and index.count(auths[1].id) == 2
+    assert auths[2].id not in index and index.records == {}
+    assert index.missing() == [424242]
+    assert index.missing(lambda xref: xref != auths[0].id) == [auths[0].id]
+
+    index = ReferenceIndex(xrefs=[auths[0].id, auths[2].id])
+    assert len(index) == 1 and index.records == {auths[0].id: sorted(bib.id for bib in bibs)}
+
+    index = ReferenceIndex(query={'_id': bibs[0].id})
+    assert index.count(auths[0].id) == 1 and 424242 not in index
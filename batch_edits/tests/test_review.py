@@ -0,0 +1,39 @@
+from dlx import DB
+from dlx.marc import Bib
+from batch_edits.review import Review
+
+DB.connect('mongomock://localhost')
+
+def test_signatures():
+    review = Review(samples=2)
+
+    for i in range(3):
+        bib = Bib().set('008', None, 'fixed').set('100', 'e', 'x').set('245', 'a', 'title')
+        review.start()
+        state = review.before(bib)
+        bib.delete_fields('008')
+        bib.get_field('100').tag = '700'
+        bib.get_field('245').get_subfield('a').value = 'changed'
+        bib.set('500', 'a', 'note')
+        review.after('edit_x', state, bib)
+        state = review.before(bib)
+        review.after('edit_y', state, bib)
+        assert review.finish(i) == ['edit_x: added 500, changed 245, deleted 008, moved 100 to 700']
+
+    # deleted and added again as it was, as the 991 fields are
+    review.start()
+    state = review.before(bib)
+    bib.delete_fields('500')
+    bib.set('500', 'a', 'note')
+    review.after('edit_z', state, bib)
+    assert review.finish(3) == []
+
+    assert review.groups == {'edit_x: added 500, changed 245, deleted 008, moved 100 to 700': {'count': 3, 'samples': [0, 1]}}
+
+def test_prompt(capsys):
+    review = Review()
+    review.groups = {'edit_a: deleted 222': {'count': 1, 'samples': [1]}, 'edit_b: changed 710': {'count': 2, 'samples': [2, 3]}}
+    answers = iter(['y', 'n'])
+
+    assert review.prompt(lambda _: next(answers)) == {'edit_b: changed 710'}
+    assert '2 record(s), e.g. 2, 3' in capsys.readouterr().out
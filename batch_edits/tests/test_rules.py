@@ -0,0 +1,84 @@
+import json, pytest
+from dlx import DB
+from dlx.marc import Bib
+from batch_edits.rules import RuleSet, Pattern, delete_fields
+
+DB.connect('mongomock://localhost')
+
+def test_actions():
+    bib = Bib().set('222', 'a', 'dummy').set('040', 'a', 'NNUN').set('040', 'b', 'eng').set('245', 'a', 'title', ind1='1', ind2='0').set('773', 'a', 'dummy', ind1='1')
+    rules = RuleSet([
+        {'action': 'delete_field', 'tag': '222'},
+        {'action': 'delete_subfield', 'tag': '040', 'code': 'b'},
+        {'action': 'clear_indicators', 'tag': '245'},
+        {'action': 'change_tag', 'tag': '773', 'to': '580'},
+        {'action': 'clear_indicators', 'tag': '580'},
+    ])
+    assert rules.tags == {'222', '040', '245', '773', '580'} and rules.adds == {'580'}
+
+    rules.apply(bib)
+    assert not bib.get_fields('222')
+    assert bib.get_values('040', 'a') == ['NNUN'] and not bib.get_value('040', 'b')
+    assert (bib.get_field('245').ind1, bib.get_field('245').ind2) == (' ', ' ')
+    assert not bib.get_field('773') and bib.get_field('580').ind1 == ' '
+
+def test_moved_fields_only_get_later_rules():
+    bib = Bib().set('100', 'e', 'dummy', ind1='1').set('700', 'e', 'other', ind1='1')
+    RuleSet([{'action': 'clear_indicators', 'tag': '700'}, {'action': 'change_tag', 'tag': '100', 'to': '700'}]).apply(bib)
+    assert {field.get_value('e'): field.ind1 for field in bib.get_fields('700')} == {'dummy': '1', 'other': ' '}
+
+def test_types_and_conditions():
+    rules = RuleSet([
+        {'action': 'delete_field', 'tag': '597', 'conditions': [['a', 'Retrospective indexing']]},
+        {'action': 'delete_field', 'tag': '269', 'types': ['speeches', 'voting']},
+    ], types=['bibliographic', 'speeches', 'voting'])
+
+    bib = Bib().set('597', 'a', 'Retrospective indexing').set('597', 'a', 'keep', address=['+']).set('269', 'a', '2000')
+    rules.apply(bib, frozenset(['bibliographic']))
+    assert bib.get_values('597', 'a') == ['keep'] and bib.get_value('269', 'a') == '2000'
+
+    rules.apply(bib)
+    assert bib.get_value('269', 'a') == '2000'
+
+    rules.apply(bib, frozenset(['speeches']))
+    assert not bib.get_field('269')
+
+def test_pattern():
+    pattern = Pattern('a', prefixes=['UN', 'UNGREY', 'CIF'], patterns=[r'\d{4}-'])
+    assert pattern(Bib().set('930', 'a', 'UNGREY1').get_field('930'))
+    assert pattern(Bib().set('930', 'a', '2001-X').get_field('930'))
+    assert not pattern(Bib().set('930', 'a', 'XUN').get_field('930'))
+    assert not pattern(Bib().set('930', 'b', 'UN').get_field('930'))
+
+    negated = Pattern('a', prefixes=['U.N'], negate=True)
+    assert negated(Bib().set('930', 'a', 'UXN').get_field('930'))
+    assert not negated(Bib().set('930', 'a', 'U.N').get_field('930'))
+
+    with pytest.raises(Exception):
+        Pattern('a')
+
+def test_delete_fields():
+    bib = Bib().set('245', 'a', 'title')
+
+    for value in ['UND1', 'other', 'PN2', 'other2']:
+        bib.set('930', 'a', value, address=['+'])
+
+    delete_fields(bib, '930', Pattern('a', prefixes=['UND', 'PN'], negate=True))
+    assert bib.get_values('930', 'a') == ['UND1', 'PN2'] and bib.get_value('245', 'a') == 'title'
+
+    rules = RuleSet([{'action': 'delete_field', 'tag': '930', 'match': {'code': 'a', 'prefixes': ['UND'], 'not': True}}])
+    rules.apply(bib)
+    assert bib.get_values('930', 'a') == ['UND1']
+
+def test_invalid_rules(tmp_path):
+    for rule in [{'action': 'dummy', 'tag': '245'}, {'action': 'delete_field', 'tag': '24'}, {'action': 'change_tag', 'tag': '245'},
+                 {'action': 'delete_subfield', 'tag': '008', 'code': 'a'}]:
+        with pytest.raises(Exception):
+            RuleSet([rule])
+
+    with pytest.raises(Exception):
+        RuleSet([{'action': 'delete_field', 'tag': '245', 'types': ['dummy']}], types=['bibliographic'])
+
+    path = tmp_path / 'rules.json'
+    path.write_text(json.dumps([{'action': 'delete_field', 'tag': '245'}]))
+    assert RuleSet.load(str(path)).tags == {'245'}
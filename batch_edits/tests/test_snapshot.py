@@ -0,0 +1,49 @@
+import copy
+from dlx import DB
+from dlx.marc import Bib, Diff
+from batch_edits.snapshot import Snapshot
+
+DB.connect('mongomock://localhost')
+
+def test_removed_matches_diff():
+    bib = Bib().set('245', 'a', 'title', ind1='1').set('040', 'a', 'keep').set('040', 'b', 'dummy').set('930', 'a', 'other')
+    before, snapshot = copy.deepcopy(bib), Snapshot(bib)
+
+    bib.get_field('245').ind1 = ' '
+    bib.get_field('040').subfields = [x for x in bib.get_field('040').subfields if x.code != 'b']
+    bib.delete_fields('930')
+    bib.set('999', 'a', 'new')
+
+    assert [f.to_mrk() for f in snapshot.removed(bib)] == [f.to_mrk() for f in Diff(before, bib).a]
+    assert len(snapshot.removed(bib)) == 3
+
+def test_changed():
+    bib = Bib().set('245', 'a', 'title')
+    snapshot = Snapshot(bib)
+    assert not snapshot.changed(bib)
+    assert snapshot.changed_tags(bib) == set()
+
+    bib.get_field('245').get_subfield('a').value = 'changed'
+    bib.set('500', 'a', 'new')
+    assert snapshot.changed(bib)
+    assert snapshot.changed_tags(bib) == {'245', '500'}
+    assert snapshot.removed(bib)[0].get_value('a') == 'title'
+
+def test_changed_ignores_order():
+    bib = Bib().set('245', 'a', 'title').set('991', 'z', 'dummy').set('500', 'a', 'note')
+    snapshot = Snapshot(bib)
+    bib.fields.append(bib.fields.pop(1))
+    assert not snapshot.changed(bib)
+
+    bib.set('999', 'a', 'new')
+    assert snapshot.changed(bib) and not snapshot.removed(bib)
+
+def test_underscore_indicators_are_blank():
+    bib = Bib().set('245', 'a', 'title', ind1='_', ind2='1')
+    snapshot = Snapshot(bib)
+
+    bib.get_field('245').ind1 = ' '
+    assert not snapshot.changed(bib)
+
+    bib.get_field('245').ind2 = ' '
+    assert snapshot.removed(bib)[0].ind1 == ' '
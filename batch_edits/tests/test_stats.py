@@ -0,0 +1,32 @@
+from dlx import DB
+from dlx.marc import Bib, Datafield
+from batch_edits.stats import EditStats
+
+DB.connect('mongomock://localhost')
+
+def test_counts():
+    stats = EditStats()
+    bib = Bib().set('040', 'a', 'keep').set('040', 'b', 'dummy').set('100', 'e', 'name').set('930', 'a', 'other')
+
+    state = stats.before(bib)
+    field = bib.get_field('040')
+    field.subfields = [x for x in field.subfields if x.code != 'b']
+    bib.get_field('100').tag = '700'
+    bib.delete_fields('930')
+    stats.after('edit', state, bib)
+
+    state = stats.before(bib)
+    stats.after('no_change', state, bib)
+
+    assert stats.edits['edit'] == {'records touched': 1, 'fields deleted': 1, 'fields moved': 1, 'subfields removed': 1}
+    assert stats.edits['no_change']['records touched'] == 0
+
+    # a field deleted and added again as it was
+    state = stats.before(bib)
+    field = bib.get_field('040')
+    bib.delete_fields('040')
+    bib.fields.append(Datafield('040', record_type='bib'))
+    bib.get_field('040').subfields = field.subfields
+    stats.after('recreate', state, bib)
+    assert sum(stats.edits['recreate'].values()) == 0
+    assert 'edit' in stats.report()
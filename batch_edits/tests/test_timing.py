@@ -0,0 +1,26 @@
+import json
+from batch_edits.timing import Timings
+
+def test_summary():
+    timings = Timings()
+    [timings.add('fast', i / 1000) for i in range(1, 101)]
+    timings.add('slow', 1)
+    summary = timings.summary()
+
+    assert list(summary) == ['fast', 'slow']
+    assert summary['fast']['calls'] == 100
+    assert summary['fast']['p50'] == 0.051
+    assert summary['fast']['p99'] == 0.1
+    assert 'fast' in timings.report()
+
+def test_sample_is_bounded_and_merged(tmp_path):
+    a, b = Timings(sample_size=10), Timings(sample_size=10)
+    [a.add('stage', 1) for _ in range(100)]
+    [b.add('stage', 1) for _ in range(100)]
+    a.merge(b)
+
+    assert a.stages['stage']['calls'] == 200
+    assert len(a.stages['stage']['sample']) == 10
+
+    a.save(str(tmp_path / 'timings.json'))
+    assert json.loads((tmp_path / 'timings.json').read_text())['stage']['total'] == 200
@@ -0,0 +1,65 @@
+"""Timing of the stages of the edit pipeline"""
+
+import json, random
+
+class Timings():
+    """Wall time per pipeline stage.
+
+    Keeps the exact call count and total time of each stage, and a fixed-size
+    random sample of the individual times for the percentiles, so memory use
+    doesn't grow with the length of the run.
+    """
+
+    def __init__(self, sample_size=10000):
+        self.sample_size = sample_size
+        self.stages = {}
+        self.random = random.Random(0)
+
+    def add(self, name, seconds):
+        stage = self.stages.setdefault(name, {'calls': 0, 'total': 0.0, 'sample': []})
+        stage['calls'] += 1
+        stage['total'] += seconds
+
+        # reservoir sampling
+        if len(stage['sample']) < self.sample_size:
+            stage['sample'].append(seconds)
+        elif (i := self.random.randrange(stage['calls'])) < self.sample_size:
+            stage['sample'][i] = seconds
+
+    def merge(self, other):
+        for name, theirs in other.stages.items():
+            ours = self.stages.setdefault(name, {'calls': 0, 'total': 0.0, 'sample': []})
+            ours['calls'] += theirs['calls']
+            ours['total'] += theirs['total']
+            sample = ours['sample'] + theirs['sample']
+            ours['sample'] = self.random.sample(sample, self.sample_size) if len(sample) > self.sample_size else sample
+
+    def summary(self):
+        """{stage: {calls, total, p50, p95, p99}}, slowest stage first. Times are in seconds."""
+        summary = {}
+
+        for name, stage in sorted(self.stages.items(), key=lambda x: -x[1]['total']):
+            sample = sorted(stage['sample'])
+            summary[name] = {'calls': stage['calls'], 'total': stage['total']}
+
+            for p in (50, 95, 99):
+                summary[name][f'p{p}'] = sample[min(len(sample) - 1, len(sample) * p // 100)] if sample else 0
+
+        return summary
+
+    def report(self):
+        summary = self.summary()
+        width = max([len(name) for name in summary] + [5])
+        lines = ['stage'.ljust(width) + '       calls     total (s)    p50 (ms)    p95 (ms)    p99 (ms)']
+
+        for name, x in summary.items():
+            lines.append(
+                name.ljust(width) + f'  {x["calls"]:>10}  {x["total"]:>12.3f}'
+                + ''.join(f'  {x[p] * 1000:>10.3f}' for p in ('p50', 'p95', 'p99'))
+            )
+
+        return '\n'.join(lines)
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
@@ -0,0 +1,163 @@
+"""Benchmark the batch-edit pipeline on synthetic records in mongomock.
+
+    python benchmarks/bench_batch_edit.py --records 1000 --mix 70,20,10 --notes 20
+
+Reports the per-record cost of each edit_ function and of the linked subfield
+preprocessing, and the end-to-end throughput of `run()` for each output mode.
+"""
+
+import os, sys, copy, time, random, tempfile
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from dlx import DB
+from dlx.marc import Bib, Auth, BibSet
+from batch_edits.auth_cache import AuthCache
+from batch_edits.scripts import batch_edit
+
+TYPES = ('Default', 'Speeches', 'Voting Data')
+PREFIXES = ('UND', 'UNP', 'UNGREY', 'CIF', 'DIG', 'HUR', 'PER', 'PN', 'XXX', 'ZZZ')
+
+def get_args():
+    parser = ArgumentParser()
+    parser.add_argument('--records', type=int, default=1000, help='Number of bibs to generate')
+    parser.add_argument('--auths', type=int, default=200, help='Number of auths of each heading type to generate')
+    parser.add_argument('--mix', default='70,20,10', help='Percentage of default, speech and voting bibs')
+    parser.add_argument('--notes', type=int, default=10, help='Number of 500 fields per bib, to vary the record size')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--modes', default='stats,mrk,db', help='run() output modes to time, in order. db modifies the corpus.')
+
+    return parser.parse_args()
+
+def make_auths(n):
+    """Commit `n` auths for each heading tag used by the linked bib fields. Returns {heading tag: [ids]}"""
+    auths = {}
+
+    for tag in ('100', '110', '111', '150'):
+        for i in range(n):
+            auth = Auth().set(tag, 'a', f'{tag} heading {i}').set(tag, 'g', f'{tag} g {i}')
+            auth.commit(user='bench')
+            auths.setdefault(tag, []).append(auth.id)
+
+    for i in range(n):
+        auth = Auth().set('190', 'b', f'A/{i}').set('190', 'c', str(2000 + i % 25))
+        auth.commit(user='bench')
+        auths.setdefault('190', []).append(auth.id)
+
+        auth = Auth().set('191', 'a', f'A/RES/{i}').set('191', 'b', f'A/{i}').set('191', 'c', str(2000 + i % 25))
+        auth.commit(user='bench')
+        auths.setdefault('191', []).append(auth.id)
+
+    return auths
+
+def make_bib(rng, record_type, auths, notes):
+    bib = Bib()
+
+    if record_type != 'Default':
+        bib.set('989', 'a', record_type)
+
+    bib.set('000', None, 'leader').set('008', None, 'fixed')
+    bib.set('029', 'a', rng.choice(['JN', 'UN', 'XX']))
+    bib.set('035', 'a', f'(DHL){rng.randrange(10 ** 6)}')
+    bib.set('040', 'a', 'NNUN').set('040', 'b', 'eng')
+    bib.set('069', 'a', 'dummy')
+    bib.set('079', 'q', 'dummy')
+    bib.set('089', 'a', rng.choice(['veto', 'other']))
+    bib.set('099', 'a', 'DHU').set('099', 'c', rng.choice(['internet', '', 'stacks']))
+    bib.set('245', 'a', f'Title {rng.randrange(10 ** 6)}', ind1='1', ind2='0')
+    bib.set('246', 'a', 'Other title', ind1='3', ind2='1')
+    bib.set('250', 'a', 'Edition =').set('250', 'b', 'Edition')
+    bib.set('269', 'a', str(rng.randrange(1990, 2025)))
+    bib.set('490', 'a', 'Series').set('490', 'x', f'{rng.randrange(10 ** 4):04}-{rng.randrange(10 ** 4):04}')
+    bib.set('520', 'a', 'Abstract').set('520', 'b', 'more').set('520', '9', 'x')
+
+    for i in range(notes):
+        bib.set('500', 'a', f'Note {i} ' + 'x' * rng.randrange(20, 200), address=['+'])
+
+    for tag, auth_tag in (('600', '100'), ('610', '110'), ('611', '111'), ('650', '150'), ('700', '100'), ('710', '110')):
+        for _ in range(rng.randrange(0, 3)):
+            bib.set(tag, 'a', rng.choice(auths[auth_tag]), ind1=rng.choice([' ', '1']), address=['+'])
+
+    if record_type == 'Default':
+        bib.set('100', 'a', rng.choice(auths['100']))
+        bib.set('773', 'a', 'Host item')
+        bib.set('930', 'a', rng.choice(PREFIXES) + str(rng.randrange(100)))
+        bib.set('930', 'a', rng.choice(PREFIXES) + str(rng.randrange(100)), address=['+'])
+    else:
+        bib.set('191', 'b', rng.choice(auths['190']))
+        bib.set('991', 'a', rng.choice(auths['191']))
+
+    [bib.set(tag, 'a', 'dummy') for tag in ('910', '920', '949', '955', '995')]
+
+    return bib
+
+def make_corpus(args):
+    rng = random.Random(args.seed)
+    weights = [int(x) for x in args.mix.split(',')]
+    auths = make_auths(args.auths)
+
+    for _ in range(args.records):
+        make_bib(rng, rng.choices(TYPES, weights)[0], auths, args.notes).commit(user='bench')
+
+def timed(f, records):
+    """Seconds per record to run `f` on each of `records`"""
+    start = time.perf_counter()
+    [f(record) for record in records]
+
+    return (time.perf_counter() - start) / len(records)
+
+def bench_stages(records):
+    results = []
+
+    with redirect_stdout(open(os.devnull, 'w')):
+        batch_edit.AUTH_CACHE = AuthCache()
+        results.append(('_reimport_991_from_linked_auth_191 (cold cache)', timed(batch_edit._reimport_991_from_linked_auth_191, copy.deepcopy(records))))
+        results.append(('_reimport_991_from_linked_auth_191 (warm cache)', timed(batch_edit._reimport_991_from_linked_auth_191, copy.deepcopy(records))))
+        batch_edit.AUTH_CACHE = AuthCache()
+        results.append(('_preprocess_linked_subfields_before_edits (cold cache)', timed(batch_edit._preprocess_linked_subfields_before_edits, copy.deepcopy(records))))
+        results.append(('_preprocess_linked_subfields_before_edits (warm cache)', timed(batch_edit._preprocess_linked_subfields_before_edits, copy.deepcopy(records))))
+
+        for edit in batch_edit._get_edits():
+            results.append((edit.__name__, timed(edit, copy.deepcopy(records))))
+
+    return results
+
+def bench_run(modes, count):
+    results = []
+    tmp = tempfile.mkdtemp()
+
+    for mode in modes:
+        kwargs = {'connect': 'mongomock://localhost', 'output': mode}
+
+        if mode == 'mrk':
+            kwargs['output_file'] = os.path.join(tmp, 'out.mrk')
+        elif mode == 'db':
+            kwargs.update(skip_confirm=True, batch_size=500)
+
+        start = time.perf_counter()
+
+        with redirect_stdout(open(os.devnull, 'w')):
+            batch_edit.run(**kwargs)
+
+        results.append((f'run(output={mode})', count / (time.perf_counter() - start)))
+
+    return results
+
+def main():
+    args = get_args()
+    DB.connect('mongomock://localhost')
+    print(f'Generating {args.records} bibs...', file=sys.stderr)
+    make_corpus(args)
+    records = list(BibSet.from_query({}))
+
+    print(f'{"stage":<58}{"us/record":>12}')
+
+    for name, seconds in bench_stages(records):
+        print(f'{name:<58}{seconds * 10 ** 6:>12.1f}')
+
+    print(f'\n{"end to end":<58}{"records/s":>12}')
+
+    for name, rate in bench_run(args.modes.split(','), len(records)):
+        print(f'{name:<58}{rate:>12.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -27,7 +27,9 @@ setup(
     entry_points = {
         # see https://python-packaging.readthedocs.io/en/latest/command-line-scripts.html#the-console-scripts-entry-point
         'console_scripts': [
-            'batch-edit=batch_edits.scripts.batch_edit:run'
+            'batch-edit=batch_edits.scripts.batch_edit:run',
+            'batch-delete-fields=batch_edits.scripts.delete_fields:run',
+            'batch-delete-auths=batch_edits.scripts.delete_auths:run'
         ]
     }
 )